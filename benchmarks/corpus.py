@@ -0,0 +1,123 @@
+"""
+Generate a synthetic corpus of enhanced snippets to benchmark against.
+
+The corpus is deterministic for any given seed, and tries to resemble what a
+real installation looks like: most snippets have a scope and no glob, a few are
+restricted to particular file names, some have fields with options to pick
+from, and some use the enhancement variables.
+"""
+import random
+import string
+
+
+## ----------------------------------------------------------------------------
+
+
+# Scope selectors to pick from, along with a relative weight for each; several
+# snippets sharing the same selector is the common case.
+_scopes = [
+    ('source.python', 6),
+    ('source.js, source.ts', 4),
+    ('text.html - (meta.tag | meta.character.less-than) - source', 3),
+    ('source.c++', 2),
+    ('text.html.markdown', 2),
+    ('source.python meta.function', 1),
+    ('-source', 1),
+    ('', 1),
+]
+
+# Globs to pick from and their relative weights; most snippets have no glob.
+_globs = [
+    ('', 24),
+    ('*.py', 2),
+    ('test_*.py', 1),
+    ('*.md', 1),
+    ('*.html', 1),
+]
+
+# The enhancement variables that the bodies of snippets can use.
+_variables = [
+    '${DATE}',
+    '${DATE:%Y-%m-%d}',
+    '${DATE:%H:%M}',
+    '${BUZZWORD}',
+    '${BUZZWORD:2}',
+    '${CLIPBOARD}',
+]
+
+# The percentage of snippets that have fields with options, and that use
+# enhancement variables.
+_options_percent = 20
+_variables_percent = 30
+
+
+## ----------------------------------------------------------------------------
+
+
+def _word(rng, min_len=3, max_len=9):
+    return ''.join(rng.choice(string.ascii_lowercase)
+                   for _ in range(rng.randint(min_len, max_len)))
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def _quote(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _snippet(rng):
+    """
+    Generate the text of a single enhanced snippet.
+    """
+    header = [f'tabTrigger: {_quote(_word(rng, 2, 8))}',
+              f'description: {_quote(" ".join(_word(rng) for _ in range(3)))}']
+
+    scope = _weighted(rng, _scopes)
+    if scope:
+        header.append(f'scope: {_quote(scope)}')
+
+    glob = _weighted(rng, _globs)
+    if glob:
+        header.append(f'glob: {_quote(glob)}')
+
+    field_count = rng.randint(1, 4)
+    if rng.randrange(100) < _options_percent:
+        header.append('options:')
+        for field in rng.sample(range(1, field_count + 1), rng.randint(1, field_count)):
+            header.append(f'  - field: {field}')
+            header.append(f'    placeholder: {_quote(_word(rng))}')
+            header.append( '    values:')
+            for _ in range(rng.randint(2, 6)):
+                if rng.randrange(3):
+                    header.append(f'      - {_quote(_word(rng))}')
+                else:
+                    header.append(f'      - text: {_quote(_word(rng))}')
+                    header.append(f'        details: {_quote(_word(rng))}')
+
+    body = [f'{_word(rng)} ${{{field}:{_word(rng)}}}' for field in range(1, field_count + 1)]
+    if rng.randrange(100) < _variables_percent:
+        body.extend(rng.sample(_variables, rng.randint(1, 3)))
+    body.append('$0')
+
+    return '---\n{0}\n---\n{1}\n'.format('\n'.join(header), '\n'.join(body))
+
+
+def generate(snippets, packages, seed=0):
+    """
+    Generate the given number of snippets spread across the given number of
+    packages, returning back a dictionary whose keys are package resource names
+    and whose values are the text of the snippets.
+    """
+    rng = random.Random(seed)
+    result = {}
+    for idx in range(snippets):
+        pkg = f'Package{idx % packages:03}'
+        result[f'Packages/{pkg}/snippets/snippet{idx:05}.enhanced-sublime-snippet'] = _snippet(rng)
+
+    return result
+
+
+## ----------------------------------------------------------------------------
@@ -0,0 +1,188 @@
+"""
+Compare the speed of the fast snippet header loader against the full YAML
+SafeLoader path, using a corpus of real snippet files.
+
+This runs outside of Sublime Text, using a plain Python 3.8 interpreter:
+
+    python3 benchmarks/header_loader.py [FOLDER ...]
+
+Every enhanced snippet file found in the given folders (such as your Sublime
+Text Packages folder) is loaded; if no folders are given, a small built in set
+of sample headers is used instead. For every header, the result of the fast
+loader is verified to be identical to what YAML produces; a set of headers with
+unusual whitespace is verified the same way, and the fast loader must fall back
+for any of them that YAML rejects.
+"""
+import importlib.util
+import os
+import sys
+import types
+
+from timeit import default_timer as timer
+
+
+## ----------------------------------------------------------------------------
+
+
+# The root of the package that we're benchmarking.
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The number of times that each header is parsed by each loader.
+_rounds = 20
+
+# Sample headers to use when no corpus folders are provided; these are taken
+# from the documentation.
+_samples = [
+    """
+tabTrigger: 'lorem'
+scope: '-source'
+description: 'Lorem ipsum'
+""",
+    """
+tabTrigger: 'test'
+description: 'Create unit test'
+scope: 'source.python'
+glob: 'test_*.py'
+""",
+    """
+tabTrigger: 'wind'
+scope: 'text.html - (meta.tag | meta.character.less-than) - source.php'
+description: 'Windstorm HTML Template'
+options:
+  - field: 2
+    placeholder: 'Windstorm Version Number'
+    values:
+      - '0.1.17'
+      - '0.1.16'
+      - text: 'latest'
+        details: 'the most recent release'
+""",
+]
+
+# Headers that are only used to verify that the fast loader agrees with YAML;
+# the whitespace in these is either significant to YAML or an error.
+_edge_cases = [
+    "a: x\xa0",
+    "a: x\xa0y",
+    "k: a\t",
+    "k: \tx",
+    "k:\tx",
+    "k: 'a'\t",
+    "\tk: x",
+    "k: x\u3000",
+    "k:\n  - a\t\n",
+]
+
+
+## ----------------------------------------------------------------------------
+
+
+def bootstrap():
+    """
+    Make the package importable as EnhancedSnippets without Sublime, and
+    return back the yaml module and the header loader module.
+
+    The header loader is loaded directly from its file, since importing it
+    through the lib package would require the Sublime API.
+    """
+    pkg = types.ModuleType('EnhancedSnippets')
+    pkg.__path__ = [_root]
+    sys.modules.setdefault('EnhancedSnippets', pkg)
+
+    from EnhancedSnippets import yaml, frontmatter
+
+    name = 'EnhancedSnippets.lib.header_loader'
+    spec = importlib.util.spec_from_file_location(name,
+                    os.path.join(_root, 'lib', 'header_loader.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return yaml, frontmatter, module
+
+
+def load_corpus(frontmatter, folders):
+    """
+    Find all of the enhanced snippets in the given folders and return back a
+    list of (name, header) tuples for them.
+    """
+    handler = frontmatter.YAMLHandler()
+    result = []
+    for folder in folders:
+        for path, dirs, files in os.walk(folder):
+            for name in files:
+                if not name.endswith('.enhanced-sublime-snippet'):
+                    continue
+
+                filename = os.path.join(path, name)
+                with open(filename, 'rt', encoding='utf-8') as file:
+                    text = frontmatter.u(file.read()).strip()
+
+                try:
+                    header, content = handler.split(text)
+                    result.append((filename, header))
+                except ValueError:
+                    pass
+
+    return result
+
+
+def verify(yaml, loader, headers):
+    """
+    Verify that the fast loader agrees with YAML on every header that it can
+    handle, displaying any mismatches, and return back the number of headers
+    that need to fall back to YAML.
+    """
+    fallbacks = 0
+    for name, header in headers:
+        fast = loader.load_snippet_header(header)
+        if fast is None:
+            fallbacks += 1
+            continue
+
+        try:
+            expected = yaml.load(header, Loader=yaml.SafeLoader) or {}
+        except yaml.YAMLError as error:
+            expected = f'error: {error.__class__.__name__}'
+
+        if fast != expected:
+            print(f'mismatch in {name}:\n  fast: {fast!r}\n  yaml: {expected!r}')
+
+    return fallbacks
+
+
+def measure(func, headers):
+    """
+    Call the given function for every header the configured number of times,
+    returning back the total elapsed time.
+    """
+    start = timer()
+    for _ in range(_rounds):
+        for name, header in headers:
+            func(header)
+
+    return timer() - start
+
+
+def main(folders):
+    yaml, frontmatter, loader = bootstrap()
+
+    headers = load_corpus(frontmatter, folders)
+    if not headers:
+        headers = [(f'sample {idx}', text) for idx, text in enumerate(_samples)]
+
+    verify(yaml, loader, [(f'edge case {case!r}', case) for case in _edge_cases])
+    fallbacks = verify(yaml, loader, headers)
+
+    yaml_time = measure(lambda h: yaml.load(h, Loader=yaml.SafeLoader), headers)
+    fast_time = measure(lambda h: loader.load_snippet_header(h) or
+                                  yaml.load(h, Loader=yaml.SafeLoader), headers)
+
+    count = len(headers) * _rounds
+    print(f'headers:        {len(headers)} ({fallbacks} need the YAML fallback)')
+    print(f'yaml loader:    {yaml_time * 1000:9.2f}ms ({yaml_time / count * 1e6:.1f}us per header)')
+    print(f'fast loader:    {fast_time * 1000:9.2f}ms ({fast_time / count * 1e6:.1f}us per header)')
+    print(f'speedup:        {yaml_time / fast_time:9.2f}x')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,200 @@
+"""
+Benchmark the snippet manager against a synthetic corpus of snippets, outside
+of Sublime Text, using a plain Python 3.8 interpreter:
+
+    python3 benchmarks/snippets.py [--snippets N] [--packages M] [--rounds R]
+
+The Sublime API is provided by the stand-in modules in the stubs folder, and
+the snippets are generated by the corpus module. Timings are reported for:
+
+  - cold scan: loading every snippet with no snippet cache present
+  - cached scan: loading every snippet with an up to date snippet cache
+  - package rescan: rescanning a single package in which one snippet changed
+  - completion query: answering a completion request in a view
+  - expansion: running insert_enhanced_snippet for a snippet
+
+Every timing includes running any callbacks that the operation scheduled with
+set_timeout() or set_timeout_async(), since that is work that Sublime would
+also need to do.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import types
+
+from timeit import default_timer as timer
+
+
+## ----------------------------------------------------------------------------
+
+
+# The root of the package that we're benchmarking, and the folder that holds
+# the stand-in modules for the Sublime API.
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_stubs = os.path.join(_root, 'benchmarks', 'stubs')
+
+# The file names and scopes of the views that completion queries and
+# expansions are performed in.
+_views = [
+    ('/project/module.py', 'source.python meta.function.python'),
+    ('/project/test_module.py', 'source.python'),
+    ('/project/index.html', 'text.html.basic'),
+    ('/project/README.md', 'text.html.markdown'),
+    (None, 'source.js'),
+]
+
+
+## ----------------------------------------------------------------------------
+
+
+def bootstrap(resources, cache_folder, workers):
+    """
+    Make the package importable as EnhancedSnippets using the stand-in Sublime
+    API, load the plugin with the given resources visible, and return back the
+    package module.
+    """
+    sys.path.insert(0, _stubs)
+    sys.path.insert(0, os.path.join(_root, 'benchmarks'))
+
+    pkg = types.ModuleType('EnhancedSnippets')
+    pkg.__path__ = [_root]
+    sys.modules.setdefault('EnhancedSnippets', pkg)
+
+    import sublime
+    sublime.resources.update(resources)
+    sublime.cache_folder = cache_folder
+    sublime.load_settings('EnhancedSnippets.sublime-settings').set('scan_workers', workers)
+
+    import EnhancedSnippets.enhanced_snippets as plugin
+    plugin.plugin_loaded()
+    sublime.run_timeouts()
+
+    return plugin
+
+
+def measure(func, rounds, setup=None):
+    """
+    Call the given function the given number of times, calling the setup
+    function (if any) before each call, and return back a list of the time
+    that each call took, including any callbacks that it scheduled.
+    """
+    import sublime
+
+    result = []
+    for idx in range(rounds):
+        if setup is not None:
+            setup(idx)
+            sublime.run_timeouts()
+
+        start = timer()
+        func(idx)
+        sublime.run_timeouts()
+        result.append(timer() - start)
+
+    return result
+
+
+def report(name, times, count=1, unit='op'):
+    """
+    Display the timing results for a single benchmark; when each of the times
+    covers more than one operation, the per operation time is also displayed.
+    """
+    best = min(times)
+    median = statistics.median(times)
+    line = f'{name:18} best {best * 1000:9.2f}ms  median {median * 1000:9.2f}ms'
+    if count > 1:
+        line += f'  ({median / count * 1e6:.1f}us per {unit})'
+
+    print(line)
+
+
+## ----------------------------------------------------------------------------
+
+
+def main(args):
+    import corpus
+
+    resources = corpus.generate(args.snippets, args.packages, args.seed)
+    cache_folder = tempfile.mkdtemp(prefix='es_benchmark_')
+    try:
+        run(args, resources, cache_folder)
+    finally:
+        shutil.rmtree(cache_folder, ignore_errors=True)
+
+
+def run(args, resources, cache_folder):
+    plugin = bootstrap(resources, cache_folder, args.workers)
+
+    import sublime
+    from EnhancedSnippets.src.core import _settings_listener
+    from EnhancedSnippets.src.events import AugmentedSnippetEventListener
+    from EnhancedSnippets.src.commands import InsertEnhancedSnippetCommand
+
+    manager_class = plugin.SnippetManager
+    enhancements = manager_class.instance.enhancements
+
+    def clear_cache(idx):
+        shutil.rmtree(cache_folder, ignore_errors=True)
+
+    def startup(idx):
+        manager_class.instance = None
+        manager_class(_settings_listener, enhancements)
+
+    print(f'snippets:          {args.snippets} in {args.packages} packages '
+          f'({args.workers} scan workers)')
+
+    report('cold scan', measure(startup, args.rounds, setup=clear_cache))
+    report('cached scan', measure(startup, args.rounds))
+
+    # Each rescan alters a different snippet in the package being scanned, so
+    # that there is always exactly one snippet that needs to be reloaded.
+    pkg_res = sorted(r for r in resources if r.startswith('Packages/Package000/'))
+    def edit_snippet(idx):
+        res = pkg_res[idx % len(pkg_res)]
+        sublime.resources[res] = resources[res].replace('$0', f'{idx} $0')
+
+    manager = manager_class.instance
+    report('package rescan', measure(lambda idx: manager.scan_pkg('Package000'),
+                                     args.rounds, setup=edit_snippet))
+
+    # Query completions for every letter as a prefix in each of the views.
+    listener = AugmentedSnippetEventListener()
+    views = [sublime.View(name, scope) for name, scope in _views]
+    prefixes = 'abcdefghijklmnopqrstuvwxyz'
+    def query(idx):
+        for view in views:
+            for prefix in prefixes:
+                listener.on_query_completions(view, prefix, [0])
+
+    report('completion query', measure(query, args.rounds),
+           len(views) * len(prefixes), 'query')
+
+    # Expand every snippet in the corpus.
+    view = views[0]
+    command = InsertEnhancedSnippetCommand(view)
+    names = sorted(sublime.resources)
+    def expand(idx):
+        for name in names:
+            command.run(None, name=name)
+        view.commands.clear()
+
+    report('expansion', measure(expand, args.rounds), len(names), 'expansion')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark snippet loading and matching')
+    parser.add_argument('--snippets', type=int, default=2000,
+                        help='the number of snippets in the corpus')
+    parser.add_argument('--packages', type=int, default=20,
+                        help='the number of packages the snippets are spread over')
+    parser.add_argument('--rounds', type=int, default=5,
+                        help='the number of times each benchmark is run')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='the value of the scan_workers setting')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='the seed for the corpus generator')
+
+    main(parser.parse_args())
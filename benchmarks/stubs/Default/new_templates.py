@@ -0,0 +1,15 @@
+"""
+A stand-in for the module of the same name in the Default package that ships
+with Sublime Text.
+"""
+import textwrap
+
+
+## ----------------------------------------------------------------------------
+
+
+def reformat(template):
+    return textwrap.dedent(template).lstrip()
+
+
+## ----------------------------------------------------------------------------
@@ -0,0 +1,352 @@
+"""
+A stand-in for the parts of the Sublime Text API that the package uses, so
+that the benchmarks can run in a plain Python interpreter.
+
+This is not a complete or exact implementation of the API; it provides just
+enough behaviour for the snippet loading, matching and expansion code paths to
+run as they would inside of Sublime. Package resources are held in memory and
+are provided by the benchmark, and callbacks scheduled with set_timeout() and
+set_timeout_async() are queued until run_timeouts() is called.
+"""
+import json
+import re
+
+from fnmatch import fnmatchcase
+
+
+## ----------------------------------------------------------------------------
+
+
+KIND_ID_COLOR_BLUISH = 12
+
+DRAW_EMPTY = 1
+DRAW_NO_FILL = 32
+DRAW_NO_OUTLINE = 256
+
+# The resources that are visible through find_resources() and load_resource();
+# the keys are resource names and the values are the text content.
+resources = {}
+
+# The folder that cache_path() reports; the benchmark points this at a
+# temporary folder.
+cache_folder = None
+
+# Callbacks scheduled with set_timeout() or set_timeout_async() that have not
+# been run yet.
+_timeouts = []
+
+# The settings objects that have been loaded, keyed by name.
+_settings = {}
+
+_clipboard = ''
+
+
+## ----------------------------------------------------------------------------
+
+
+def run_timeouts():
+    """
+    Run all of the callbacks that have been scheduled, including any that get
+    scheduled by the callbacks as they run. The delays are not honoured.
+    """
+    while _timeouts:
+        _timeouts.pop(0)()
+
+
+def set_timeout(callback, delay=0):
+    _timeouts.append(callback)
+
+
+def set_timeout_async(callback, delay=0):
+    _timeouts.append(callback)
+
+
+def find_resources(pattern):
+    return [res for res in resources if fnmatchcase(res.rsplit('/', 1)[-1], pattern)]
+
+
+def load_resource(name):
+    try:
+        return resources[name]
+    except KeyError:
+        raise FileNotFoundError(f'resource not found: {name}') from None
+
+
+def cache_path():
+    return cache_folder
+
+
+def packages_path():
+    return '/nonexistent/Packages'
+
+
+def load_settings(name):
+    return _settings.setdefault(name, Settings())
+
+
+def encode_value(value, pretty=False):
+    return json.dumps(value, indent=4 if pretty else None)
+
+
+def decode_value(data):
+    return json.loads(data)
+
+
+def get_clipboard(size_limit=16777216):
+    return _clipboard
+
+
+def set_clipboard(text):
+    global _clipboard
+    _clipboard = text
+
+
+def status_message(msg):
+    pass
+
+
+def message_dialog(msg):
+    print(f'message_dialog: {msg}')
+
+
+def error_message(msg):
+    print(f'error_message: {msg}')
+
+
+def active_window():
+    return _window
+
+
+def windows():
+    return [_window]
+
+
+## ----------------------------------------------------------------------------
+
+
+def _split(selector, separators):
+    """
+    Split a selector on any of the given separator characters, so long as they
+    are not nested inside of parenthesis.
+    """
+    parts, depth, start = [], 0, 0
+    for idx, char in enumerate(selector):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char in separators and depth == 0:
+            parts.append((selector[start:idx], char))
+            start = idx + 1
+
+    parts.append((selector[start:], None))
+    return parts
+
+
+def _match_path(scopes, path):
+    """
+    Return an indication of whether the space separated list of scope atoms in
+    the path matches the scope, in order but not necessarily adjacently.
+    """
+    idx = 0
+    atoms = path.split()
+    for scope in scopes:
+        if idx < len(atoms) and (scope == atoms[idx] or scope.startswith(atoms[idx] + '.')):
+            idx += 1
+
+    return idx == len(atoms)
+
+
+def _match_expression(scopes, expression):
+    """
+    Match an expression made up of paths and parenthesized groups that are
+    joined with the '|', '&' and '-' operators, evaluated from left to right.
+    """
+    # A '-' that starts a selector or follows whitespace is an operator; one
+    # inside of a scope name (such as in text.html.markdown-gfm) is not.
+    expression = re.sub(r'(^|\s)-', lambda m: f'{m.group(1)}\x00', expression.strip())
+
+    result = True
+    pending = None
+    for term, op in _split(expression, '|&\x00'):
+        term = term.strip()
+        if term.startswith('(') and term.endswith(')'):
+            matched = _match_selector(scopes, term[1:-1])
+        else:
+            matched = _match_path(scopes, term)
+
+        if pending is None:
+            result = matched if term else True
+        elif pending == '|':
+            result = result or matched
+        elif pending == '&':
+            result = result and matched
+        else:
+            result = result and not matched
+
+        pending = op
+
+    return result
+
+
+def _match_selector(scopes, selector):
+    return any(_match_expression(scopes, part) for part, sep in _split(selector, ','))
+
+
+def score_selector(scope_name, selector):
+    """
+    Return a non-zero value when the selector matches the scope; the actual
+    score is the number of scope atoms in the scope name, which is enough for
+    everything in the package that uses the result.
+    """
+    scopes = scope_name.split()
+    if not _match_selector(scopes, selector):
+        return 0
+
+    return max(len(scopes), 1)
+
+
+## ----------------------------------------------------------------------------
+
+
+class Settings():
+    """
+    Settings values cross the API boundary as copies, so values are copied both
+    on the way in and on the way out.
+    """
+    def __init__(self):
+        self._values = {}
+        self._callbacks = {}
+
+    def get(self, key, default=None):
+        value = self._values.get(key, default)
+        return default if value is None else json.loads(json.dumps(value))
+
+    def has(self, key):
+        return key in self._values
+
+    def set(self, key, value):
+        self._values[key] = json.loads(json.dumps(value))
+        for callback in list(self._callbacks.values()):
+            callback()
+
+    def erase(self, key):
+        self._values.pop(key, None)
+
+    def add_on_change(self, tag, callback):
+        self._callbacks[tag] = callback
+
+    def clear_on_change(self, tag):
+        self._callbacks.pop(tag, None)
+
+
+class Region():
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return abs(self.b - self.a)
+
+
+class CompletionItem():
+    def __init__(self, trigger, annotation='', completion='', completion_format=0,
+                 kind=None, details=''):
+        self.trigger = trigger
+        self.annotation = annotation
+        self.completion = completion
+        self.completion_format = completion_format
+        self.kind = kind
+        self.details = details
+
+    @classmethod
+    def command_completion(cls, trigger, command, args={}, annotation='',
+                           kind=None, details=''):
+        item = cls(trigger, annotation, kind=kind, details=details)
+        item.command = command
+        item.args = args
+        return item
+
+
+class QuickPanelItem():
+    def __init__(self, trigger, details='', annotation='', kind=None):
+        self.trigger = trigger
+        self.details = details
+        self.annotation = annotation
+        self.kind = kind
+
+
+class View():
+    """
+    A view with a file name, in which every position has the same scope. The
+    commands that are run in the view are not executed, only recorded.
+    """
+    _next_id = 1
+
+    def __init__(self, file_name=None, scope='source.python'):
+        self._id = View._next_id
+        View._next_id += 1
+
+        self._file_name = file_name
+        self._scope = f'{scope} '
+        self._settings = Settings()
+        self.commands = []
+
+    def id(self):
+        return self._id
+
+    def file_name(self):
+        return self._file_name
+
+    def scope_name(self, pt):
+        return self._scope
+
+    def match_selector(self, pt, selector):
+        return score_selector(self._scope, selector) > 0
+
+    def settings(self):
+        return self._settings
+
+    def sel(self):
+        return [Region(0)]
+
+    def window(self):
+        return _window
+
+    def run_command(self, cmd, args=None):
+        self.commands.append((cmd, args))
+
+    def add_regions(self, key, regions, *args, **kwargs):
+        pass
+
+    def get_regions(self, key):
+        return []
+
+    def erase_regions(self, key):
+        pass
+
+
+class Window():
+    def __init__(self):
+        self._view = None
+
+    def active_view(self):
+        return self._view
+
+    def views(self):
+        return [] if self._view is None else [self._view]
+
+    def run_command(self, cmd, args=None):
+        pass
+
+
+_window = Window()
+
+
+## ----------------------------------------------------------------------------
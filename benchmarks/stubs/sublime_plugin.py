@@ -0,0 +1,34 @@
+"""
+A stand-in for the plugin base classes of the Sublime Text API, so that the
+commands and event listeners in the package can be imported and driven by the
+benchmarks in a plain Python interpreter.
+"""
+
+
+## ----------------------------------------------------------------------------
+
+
+class EventListener():
+    pass
+
+
+class ViewEventListener():
+    def __init__(self, view):
+        self.view = view
+
+
+class ApplicationCommand():
+    pass
+
+
+class WindowCommand():
+    def __init__(self, window):
+        self.window = window
+
+
+class TextCommand():
+    def __init__(self, view):
+        self.view = view
+
+
+## ----------------------------------------------------------------------------
@@ -121,12 +121,13 @@ import json
 import re
 import EnhancedSnippets.yaml as yaml
 
+from EnhancedSnippets.yaml import SafeDumper
+from EnhancedSnippets.yaml import SafeLoader
+
 try:
-    from EnhancedSnippets.yaml import CSafeDumper as SafeDumper
-    from EnhancedSnippets.yaml import CSafeLoader as SafeLoader
+    from EnhancedSnippets.yaml import CSafeDumper, CSafeLoader
 except ImportError:
-    from EnhancedSnippets.yaml import SafeDumper
-    from EnhancedSnippets.yaml import SafeLoader
+    CSafeDumper = CSafeLoader = None
 
 try:
     import toml
@@ -138,6 +139,32 @@ from .util import u
 
 __all__ = ["BaseHandler", "YAMLHandler", "JSONHandler"]
 
+
+def _libyaml_compatible():
+    """
+    The libyaml based loader is only available when a ``_yaml`` extension can
+    be imported, which may have been built for some other version of YAML than
+    the one we ship. Verify that it parses a small document the same way that
+    the pure Python loader does before trusting it.
+    """
+    if CSafeLoader is None:
+        return False
+
+    probe = "a: [1, 'two', 3.5]\nb: {c: null, d: true}\ne: |\n  text\n"
+    try:
+        return (yaml.load(probe, Loader=CSafeLoader) ==
+                yaml.load(probe, Loader=SafeLoader))
+    except Exception:
+        return False
+
+
+# Prefer the libyaml versions of the loader and dumper when they work, since
+# they are an order of magnitude faster.
+if _libyaml_compatible():
+    LOADER, DUMPER = CSafeLoader, CSafeDumper
+else:
+    LOADER, DUMPER = SafeLoader, SafeDumper
+
 if toml:
     __all__.append("TOMLHandler")
 
@@ -233,18 +260,23 @@ class YAMLHandler(BaseHandler):
     FM_BOUNDARY = re.compile(r"^-{3,}\s*$", re.MULTILINE)
     START_DELIMITER = END_DELIMITER = "---"
 
+    # The default loader and dumper; these are the libyaml versions when a
+    # compatible extension is available, and the pure Python ones otherwise.
+    LOADER = LOADER
+    DUMPER = DUMPER
+
     def load(self, fm, **kwargs):
         """
         Parse YAML front matter. This uses yaml.SafeLoader by default.
         """
-        kwargs.setdefault("Loader", SafeLoader)
+        kwargs.setdefault("Loader", self.LOADER)
         return yaml.load(fm, **kwargs)
 
     def export(self, metadata, **kwargs):
         """
         Export metadata as YAML. This uses yaml.SafeDumper by default.
         """
-        kwargs.setdefault("Dumper", SafeDumper)
+        kwargs.setdefault("Dumper", self.DUMPER)
         kwargs.setdefault("default_flow_style", False)
         kwargs.setdefault("allow_unicode", True)
 
@@ -1,7 +1,7 @@
 from ..enhanced_snippets import reload
 
-reload("lib", ["utils", "snippet_manager", "enhancement_manager",
-               "settings_listener"])
+reload("lib", ["perf", "header_loader", "utils", "snippet_cache",
+               "snippet_manager", "enhancement_manager", "settings_listener"])
 reload("lib.enhancements")
 
 from .utils import *
@@ -2,12 +2,17 @@ import sublime
 
 import sys
 import importlib
+import re
+import time
 
-from collections import namedtuple
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from threading import Lock
 from traceback import print_tb
 
 from .enhancements import install_builtin_enhancements, EnhancedSnippetBase
-from .utils import log
+from .utils import log, debug
+from . import perf
 
 from importlib import import_module
 
@@ -43,6 +48,26 @@ _ENHANCEMENT_TRIGGER_FILE = '.enhanced-snippets'
 _ENHANCEMENT_MODULE = 'snippet_enhancers'
 
 
+# The number of threads in the pool that the values of asynchronous
+# enhancements are produced in.
+_ASYNC_WORKERS = 4
+
+# The number of seconds that values produced by an enhancement's prefetch()
+# method remain fresh enough to be used when a snippet expands.
+_PREFETCH_TTL = 5
+
+# An enhancement is quarantined when this many of its most recent calls took
+# longer than the enhancement_budget setting allows, out of the number of most
+# recent calls that are tracked.
+_QUARANTINE_STRIKES = 3
+_QUARANTINE_WINDOW = 10
+
+# A use of a variable that has been rewritten to be a plain reference to some
+# variable; uses of asynchronous enhancements in this form keep their default
+# text, so that it's used if the value isn't ready in time.
+_VARIABLE_REF = re.compile(r'\$\{(\w+)\}$')
+
+
 ## ----------------------------------------------------------------------------
 
 
@@ -71,10 +96,10 @@ _ENHANCEMENT_MODULE = 'snippet_enhancers'
 #         goes away we can drop its stuff.
 #
 #  REMEMBER: Except at startup, any change to the list of extensions requires
-#            that all snippets be rescanned. This probably means that for
-#            ultimate coolness we need to store for each snippet the variables
-#            that it requires so that we know which snippets to tweak when
-#            things change.
+#            that the snippets that use the affected variables have their
+#            expansion plans recreated; listeners are told which variables
+#            changed, and the snippet manager keeps an index of which snippets
+#            use which variables so that only those are touched.
 #
 
 class EnhancementManager():
@@ -94,7 +119,107 @@ class EnhancementManager():
     _modules = {}
 
     def __init__(self):
-        self.scan_for_enhancements()
+        # Set up a list for registered callbacks; any functions in this list
+        # are called with the set of variable names whose enhancements have
+        # been added, replaced or removed.
+        self.listeners = []
+
+        # While a scan is in progress, this is the set of variable names that
+        # have changed so far; listeners are told about them all at once when
+        # the scan completes. Outside of a scan this is None.
+        self._pending = None
+
+        # A tuple of the regular expression that matches a use of any of the
+        # variables whose enhancements can be compiled in a single pass, and
+        # the set of the names of those variables; this is None when the list
+        # of enhancements has changed and it needs to be rebuilt.
+        self._scanner = None
+
+        # The pool of threads that asynchronous enhancements run in; this is
+        # created the first time that it's needed.
+        self._pool = None
+
+        # The thread that prefetching happens in, and the future for the
+        # prefetch that it's working on (if any); prefetching has its own
+        # thread so that it can't hold up expansions that have a deadline.
+        self._prefetch_pool = None
+        self._prefetch_future = None
+
+        # The set of the names of the variables whose enhancements implement
+        # prefetch(); this is None when the list of enhancements has changed
+        # and it needs to be recreated.
+        self._prefetchers = None
+
+        # Values produced by prefetch(); the keys are tuples of the resource of
+        # a snippet and a variable name, and the values are tuples of the slots
+        # the values were produced for, the time they were produced and the
+        # values themselves (None while they are still being produced).
+        # Prefetching happens in the background, so the lock protects access.
+        self._prefetched = {}
+        self._prefetch_lock = Lock()
+
+        # Values memoized for enhancements that implement memo_ttl(); the keys
+        # are tuples of a variable name and the set of the memo_key() values
+        # used by an expansion, and the values are tuples of the time at which
+        # the entry expires and a dictionary of the values by memo_key().
+        # Expansions can happen in the background, so the lock protects
+        # access.
+        self._memo = {}
+        self._memo_lock = Lock()
+
+        # For each enhancement module (see SnippetVariable), a deque of how
+        # long its most recent calls took while snippets were expanding or
+        # being prefetched, and the set of the modules that are quarantined
+        # because their calls took too long; quarantined enhancements are
+        # treated as if they did not exist. Calls can happen in the
+        # background, so the lock protects access.
+        self._timings = {}
+        self.quarantined = set()
+        self._timing_lock = Lock()
+
+        # The number of seconds that a call to an enhancement can take before
+        # it counts towards quarantining it; this is checked for every call,
+        # so the value of the setting is cached here and updated when the
+        # settings change.
+        from ..src.core import es_setting
+        self._budget = es_setting('enhancement_budget') / 1000
+
+        # Importing enhancements can be slow, so defer the scan until after the
+        # plugin has finished loading; listeners are told about the variables
+        # as the enhancements for them are found.
+        sublime.set_timeout(lambda: self.scan_for_enhancements())
+
+
+    def add_listener(self, callback):
+        """
+        Add a listener so that when the enhancement for any variable is added,
+        replaced or removed, the callback provided is invoked.
+
+        The callback will be passed a single argument, the set of the names of
+        the variables that have changed.
+        """
+        self.listeners.append(callback)
+
+
+    def __changed(self, names):
+        """
+        Tell all listeners that the enhancements for the given variable names
+        have changed; during a scan, the names are held until the scan is done.
+        """
+        if not names:
+            return
+
+        self._scanner = None
+        self._prefetchers = None
+        with self._memo_lock:
+            self._memo = {}
+
+        if self._pending is not None:
+            self._pending.update(names)
+            return
+
+        for callback in self.listeners:
+            callback(set(names))
 
 
     def add(self, extensionClass):
@@ -122,6 +247,8 @@ class EnhancementManager():
             self._fields[entry.name] = entry
             self._modules[entry.module] = entry
 
+            self.__changed({entry.name})
+
         except Exception as error:
             log(f'Unable to load enhancements from {module}: {str(error)}')
             print_tb(error.__traceback__)
@@ -136,12 +263,379 @@ class EnhancementManager():
         result = []
         for field in field_names:
             value = self._fields.get(field, None)
-            if value is not None:
+            if value is not None and value.module not in self.quarantined:
                 result.append(value.instance)
 
         return result
 
 
+    def __get_scanner(self):
+        """
+        Return back a tuple of the combined regular expression that matches a
+        use of any variable whose enhancement can be compiled in a single pass
+        and the set of the names of those variables, building it if needed.
+        """
+        if self._scanner is None:
+            names = {name for name, entry in self._fields.items()
+                     if entry.instance.default_slots() is not None}
+            pattern = '|'.join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+            self._scanner = (re.compile(rf"\$\{{({pattern})(:[^}}]*)?}}"), names)
+
+        return self._scanner
+
+
+    def compile_content(self, content, field_names):
+        """
+        Given the content of a snippet and the list of the variable names that
+        it uses, compile the content using all of the enhancements for those
+        variables that support it in a single pass over the content.
+
+        The return value is a tuple of the (potentially modified) content, a
+        list of (enhancement, slots) tuples for the enhancements that were
+        compiled, and a list of the enhancements that could not be compiled
+        this way.
+        """
+        regex, names = self.__get_scanner()
+
+        steps = {}
+        others = []
+        for field in field_names:
+            value = self._fields.get(field, None)
+            if value is None or value.module in self.quarantined:
+                continue
+
+            if field in names:
+                steps[field] = (value.instance, value.instance.default_slots())
+            else:
+                others.append(value.instance)
+
+        # Dispatch each use of a variable to the enhancement that owns it;
+        # uses that are not rewritten are left as they are.
+        def rewrite(match):
+            step = steps.get(match.group(1))
+            if step is None:
+                return match.group(0)
+
+            default = match.group(2)
+            text = step[0].rewrite(default, step[1])
+            if text is None:
+                return match.group(0)
+
+            # Asynchronous values might not be ready in time, so make sure
+            # that the default text is still there to fall back on.
+            if default is not None and step[0].is_async():
+                ref = _VARIABLE_REF.match(text)
+                if ref:
+                    text = f'${{{ref.group(1)}{default}}}'
+
+            return text
+
+        if steps:
+            content = regex.sub(rewrite, content)
+
+        return content, list(steps.values()), others
+
+
+    def expand(self, enhancement, slots):
+        """
+        Given an enhancement and the slots from an expansion plan, return back
+        the values of the variables, as expand() would. For enhancements that
+        memoize their values, the values from an earlier expansion that used
+        the same set of values are reused; otherwise expand() is called (once)
+        to produce all of them together.
+        """
+        ttl = enhancement.memo_ttl()
+        if ttl <= 0:
+            return self.__timed(enhancement, enhancement.expand, slots)
+
+        # Variables with the same key share a value; if any of them can't be
+        # memoized, then none of them are, so that they all still agree.
+        keys = {var: enhancement.memo_key(var, slot) for var, slot in slots.items()}
+        if None in keys.values():
+            return self.__timed(enhancement, enhancement.expand, slots)
+
+        # The values for an expansion are memoized as a single entry, so that
+        # they are always produced by the same call to expand().
+        key = (enhancement.variable_name(), frozenset(keys.values()))
+        now = time.perf_counter()
+        with self._memo_lock:
+            entry = self._memo.get(key)
+
+        if entry is not None and entry[0] > now:
+            perf.increment('memo.hit')
+            values = entry[1]
+        else:
+            perf.increment('memo.miss')
+            wanted = {}
+            for var, value_key in keys.items():
+                wanted.setdefault(value_key, var)
+
+            result = self.__timed(enhancement, enhancement.expand,
+                                  {var: slots[var] for var in wanted.values()})
+            values = {value_key: result[var] for value_key, var in wanted.items()
+                      if var in result}
+
+            with self._memo_lock:
+                # Throw away anything that has expired before adding the new
+                # values.
+                for old in [old for old, entry in self._memo.items() if entry[0] <= now]:
+                    del self._memo[old]
+
+                self._memo[key] = (now + ttl, values)
+
+        return {var: values[value_key] for var, value_key in keys.items()
+                if value_key in values}
+
+
+    def variables(self, enhancement, content):
+        """
+        Given an enhancement and the content of a snippet that is expanding,
+        return back the variables and the new content, as variables() would.
+        """
+        return self.__timed(enhancement, enhancement.variables, content)
+
+
+    def __timed(self, enhancement, func, *args):
+        """
+        Call the given method of the given enhancement with the given
+        arguments, returning back the result and tracking how long it took.
+        """
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.__record_time(enhancement, time.perf_counter() - start)
+
+
+    def __module_name(self, enhancement):
+        """
+        Return back the fully qualified name of the class of the given
+        enhancement, which is how it's known in our lists and timings.
+        """
+        return f'{type(enhancement).__module__}.{type(enhancement).__name__}'
+
+
+    def __record_time(self, enhancement, elapsed):
+        """
+        Record that a call to the given enhancement took the given number of
+        seconds; if it has now taken longer than the budget allows too many
+        times, the enhancement is quarantined.
+        """
+        module = self.__module_name(enhancement)
+        perf.record('enhancement', elapsed, module)
+
+        budget = self._budget
+        with self._timing_lock:
+            timings = self._timings.get(module)
+            if timings is None:
+                timings = self._timings[module] = deque(maxlen=_QUARANTINE_WINDOW)
+
+            timings.append(elapsed)
+            if (budget <= 0 or module in self.quarantined or
+                    sum(1 for t in timings if t > budget) < _QUARANTINE_STRIKES):
+                return
+
+            self.quarantined.add(module)
+            self._prefetchers = None
+
+        log(f'{enhancement.variable_name()} ({module}) took longer than '
+            f'{budget * 1000:.0f}ms {_QUARANTINE_STRIKES} times; its default '
+            f'text will be used until it is restored', status=True)
+
+        # Snippets that use the variable need their expansion plans recreated
+        # without it, which needs to happen in the main thread.
+        name = enhancement.variable_name()
+        sublime.set_timeout(lambda: self.__changed({name}))
+
+
+    def update_budget(self, budget):
+        """
+        Called when the setting that controls how long (in milliseconds) calls
+        to enhancements can take before they count towards quarantining them
+        has changed.
+        """
+        self._budget = budget / 1000
+
+
+    def restore_quarantined(self):
+        """
+        Restore all of the enhancements that have been quarantined, so that
+        they're used again; their timing history is discarded, so they get a
+        fresh start.
+        """
+        with self._timing_lock:
+            modules, self.quarantined = self.quarantined, set()
+            for module in modules:
+                self._timings.pop(module, None)
+
+        names = {entry.name for module, entry in self._modules.items() if module in modules}
+        for module in sorted(modules):
+            log(f'restoring quarantined enhancement {module}')
+
+        self.__changed(names)
+
+
+    def submit(self, func, *args):
+        """
+        Arrange for the given function to be called with the given arguments
+        in the thread pool for asynchronous enhancements, returning back the
+        future that will hold the result.
+        """
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=_ASYNC_WORKERS,
+                                            thread_name_prefix='EnhancedSnippets')
+
+        return self._pool.submit(func, *args)
+
+
+    def wait(self, future, deadline, enhancement):
+        """
+        Given a future returned by submit() for a call into the given
+        enhancement, wait until the deadline (a time as returned by
+        time.perf_counter()) for it to finish, and return back its result. If
+        the deadline passes, or the call fails, the return value is None.
+        """
+        try:
+            return future.result(timeout=max(0, deadline - time.perf_counter()))
+
+        except TimeoutError:
+            debug('%s missed the expansion deadline; using default text',
+                  enhancement.variable_name())
+
+        except Exception as error:
+            log(f'error expanding {enhancement.variable_name()}: {str(error)}')
+
+        return None
+
+
+    def prefetch_names(self):
+        """
+        Return back the set of the names of the variables whose enhancements
+        implement prefetch().
+        """
+        if self._prefetchers is None:
+            self._prefetchers = {name for name, entry in self._fields.items()
+                                 if type(entry.instance).prefetch is not EnhancedSnippetBase.prefetch
+                                 and entry.module not in self.quarantined}
+
+        return self._prefetchers
+
+
+    def prefetch(self, requests):
+        """
+        Given a list of (resource, enhancement, slots) tuples, call prefetch()
+        for each in the background and hold on to the results for a short
+        time, so that take_prefetched() can return them when the snippet with
+        that resource expands. Requests whose values are still fresh are
+        skipped.
+
+        Only one prefetch happens at a time; if one is already in progress,
+        the requests are dropped, since they'll be made again the next time
+        the snippets are offered.
+        """
+        if self._prefetch_future is not None and not self._prefetch_future.done():
+            return
+
+        # Requests that are about to be fetched get an entry with no values,
+        # so that they're not fetched again while that happens.
+        now = time.perf_counter()
+        with self._prefetch_lock:
+            requests = [(res, enhancement, slots) for res, enhancement, slots in requests
+                        if not self.__is_fresh(self._prefetched.get((res, enhancement.variable_name())),
+                                               slots, now)]
+            for res, enhancement, slots in requests:
+                self._prefetched[(res, enhancement.variable_name())] = (slots, now, None)
+
+        # Prefetching is timed the same as expanding, so an enhancement that is
+        # slow to prefetch is quarantined; once it is, anything it still has
+        # left to prefetch is skipped.
+        def fetch():
+            for res, enhancement, slots in requests:
+                if self.__module_name(enhancement) in self.quarantined:
+                    with self._prefetch_lock:
+                        self._prefetched.pop((res, enhancement.variable_name()), None)
+                    continue
+
+                try:
+                    values = self.__timed(enhancement, enhancement.prefetch, slots)
+                except Exception as error:
+                    log(f'error prefetching {enhancement.variable_name()}: {str(error)}')
+                    continue
+
+                with self._prefetch_lock:
+                    if values is None:
+                        self._prefetched.pop((res, enhancement.variable_name()), None)
+                    else:
+                        self._prefetched[(res, enhancement.variable_name())] = (
+                            slots, time.perf_counter(), values)
+
+        if requests:
+            if self._prefetch_pool is None:
+                self._prefetch_pool = ThreadPoolExecutor(max_workers=1,
+                                                         thread_name_prefix='EnhancedSnippets-prefetch')
+
+            self._prefetch_future = self._prefetch_pool.submit(fetch)
+
+
+    def take_prefetched(self, res, enhancement, slots):
+        """
+        Given the resource of a snippet that is expanding and one of the
+        enhancements and slots in its expansion plan, return back the values
+        that were prefetched for it, if they are still fresh; otherwise the
+        return value is None. Prefetched values are only used once.
+
+        Only enhancements that prefetch, for snippets whose values were queued
+        to be prefetched, count as prefetch hits or misses.
+        """
+        if (not self._prefetched or
+                enhancement.variable_name() not in self.prefetch_names()):
+            return None
+
+        with self._prefetch_lock:
+            entry = self._prefetched.pop((res, enhancement.variable_name()), None)
+
+            # Take the opportunity to throw away anything that went stale.
+            now = time.perf_counter()
+            for key in [key for key, value in self._prefetched.items()
+                        if now - value[1] > _PREFETCH_TTL]:
+                del self._prefetched[key]
+
+        if entry is None:
+            return None
+
+        if self.__is_fresh(entry, slots, now) and entry[2] is not None:
+            perf.increment('prefetch.hit')
+            return entry[2]
+
+        perf.increment('prefetch.miss')
+        return None
+
+
+    def __is_fresh(self, entry, slots, now):
+        """
+        Return back an indication of whether the given prefetch entry (which
+        may be None) holds values for the given slots that are still fresh.
+        """
+        return (entry is not None and entry[0] is slots and
+                now - entry[1] <= _PREFETCH_TTL)
+
+
+    def shutdown(self):
+        """
+        Shut down the thread pools for asynchronous enhancements and for
+        prefetching, if there are any; calls that are still running are left
+        to finish on their own.
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+        if self._prefetch_pool is not None:
+            self._prefetch_pool.shutdown(wait=False)
+            self._prefetch_pool = None
+            self._prefetch_future = None
+
+
     def scan_for_enhancements(self, pkg_name=None):
         """
         Scan for all of the possible snippet enhancement plugins and install
@@ -149,14 +643,21 @@ class EnhancementManager():
         installation of the enhancements that are pre installed as a part of
         this package, if there is no package name given.
         """
-        if pkg_name is not None:
-            self.discard_from_package(pkg_name)
-            log(f"rescanning enhancements in package '{pkg_name}'")
-        else:
-            self._fields = {}
-            self._modules = {}
+        self._pending = set()
+        try:
+            if pkg_name is not None:
+                self.discard_from_package(pkg_name)
+                log(f"rescanning enhancements in package '{pkg_name}'")
+            else:
+                self._pending.update(self._fields.keys())
+                self._fields = {}
+                self._modules = {}
 
-        self.__install_enhancements(pkg_name)
+            self.__install_enhancements(pkg_name)
+
+        finally:
+            changed, self._pending = self._pending, None
+            self.__changed(changed)
 
 
     def discard_from_package(self, pkg_name):
@@ -166,6 +667,7 @@ class EnhancementManager():
         """
         log(f"discarding all loaded enhancements from package '{pkg_name}'")
 
+        removed = set()
         for module in list(self._modules.keys()):
             # Is this module is from the package we're clobbering?
             if module.startswith(pkg_name):
@@ -174,6 +676,9 @@ class EnhancementManager():
                 # Remove the entry from both tables
                 del self._modules[module]
                 del self._fields[entry.name]
+                removed.add(entry.name)
+
+        self.__changed(removed)
 
 
     def __add_from_package(self, pkg, res):
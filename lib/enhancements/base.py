@@ -24,8 +24,7 @@ class EnhancedSnippetBase():
         enhancement in any way it sees fit.
         """
         self.regex = re.compile(rf"\${{{self.variable_name()}(:[^}}]*)?}}")
-        name = self.__class__.__qualname__
-        debug(f"adding enhancement: {name} => {self.regex.pattern}")
+        debug("adding enhancement: %s => %s", self.__class__.__qualname__, self.regex.pattern)
 
 
     def variable_name(self):
@@ -36,6 +35,145 @@ class EnhancedSnippetBase():
         return 'NONE'
 
 
+    def is_async(self):
+        """
+        Return back an indication of whether the values for this variable
+        should be produced in the background. This is for enhancements whose
+        values are slow to produce, such as those that run an external program
+        or read files.
+
+        The expand() (or variables()) method of an asynchronous enhancement is
+        called in a background thread while the snippet is expanding, and if
+        it doesn't finish before the deadline in the enhancement_deadline
+        setting, the snippet expands without it, using the default text of
+        the variable (if any) instead.
+
+        The base class version returns False.
+        """
+        return False
+
+
+    def default_slots(self):
+        """
+        Return back the dictionary of value slots (see compile()) that every
+        snippet which uses this variable starts out with, before any of the
+        uses of the variable are rewritten by rewrite().
+
+        Enhancements that implement this method (and rewrite(), if they need
+        to change the content) are compiled by the enhancement manager in a
+        single pass over the snippet content that is shared with all of the
+        other enhancements that do the same, rather than by compile().
+
+        The base class version returns None, which indicates that this
+        enhancement does not support being compiled this way.
+        """
+        return None
+
+
+    def rewrite(self, default, slots):
+        """
+        Given the default text of a single use of this variable in a snippet
+        (including the leading colon, or None if there is no default text) and
+        the dictionary of value slots collected so far, update the slots as
+        needed and return back the text that the use should be replaced with.
+
+        The base class version returns None, which leaves the use of the
+        variable as it appears in the snippet.
+        """
+        return None
+
+
+    def compile(self, content):
+        """
+        Given a parsed snippet body, return back a tuple that contains a
+        dictionary of value slots and a (potentially modified) version of the
+        contents of the snippet. This is called once when a snippet is loaded,
+        and the result is used every time the snippet expands.
+
+        The slots dictionary has keys that are the variables that need to be
+        expanded, and values which are whatever argument expand() needs in
+        order to determine the value of that variable. Anything that depends
+        only on the content of the snippet, such as rewriting the content so
+        that each distinct use of the variable has its own name, should be done
+        here so that it doesn't need to happen at expansion time.
+
+        The base class version uses default_slots() and rewrite() to compile
+        the content; if those are not implemented it returns None, which
+        indicates that this enhancement does not support being compiled; in
+        that case variables() is called every time the snippet expands instead.
+        """
+        slots = self.default_slots()
+        if slots is None:
+            return None
+
+        def rewrite(match):
+            text = self.rewrite(match.group(1), slots)
+            return match.group(0) if text is None else text
+
+        return slots, self.regex.sub(rewrite, content)
+
+
+    def expand(self, slots):
+        """
+        Given the dictionary of value slots that compile() returned, return
+        back a dictionary of variables; the keys are the variables to be
+        expanded, and the values are the text that will be inserted when the
+        snippet expands.
+
+        The base class version returns no variables.
+        """
+        return dict()
+
+
+    def memo_ttl(self):
+        """
+        Return back the number of seconds that a value produced by expand() can
+        be reused for, or 0 if values should never be reused.
+
+        When this is larger than 0, the enhancement manager remembers the
+        values produced for an expansion under the set of keys that memo_key()
+        returns for its variables, and reuses them for any other expansion
+        with the same set of keys within that many seconds; variables with
+        the same key share a single value. Otherwise all of the values are
+        produced by a single call to expand(), so that they agree with each
+        other.
+
+        The base class version returns 0.
+        """
+        return 0
+
+
+    def memo_key(self, variable, slot):
+        """
+        Given the name of a variable and the value of its slot (see compile()),
+        return back a hashable key that identifies the value of the variable;
+        variables with the same key share the same value while it's
+        memoized (see memo_ttl()). The key can be None for a value that must
+        never be reused, in which case the expansions that use it are not
+        memoized at all.
+
+        The base class version returns the slot itself.
+        """
+        return slot
+
+
+    def prefetch(self, slots):
+        """
+        Given the dictionary of value slots that compile() returned, return
+        back the same dictionary of variables that expand() would, or None if
+        this enhancement does not prefetch its values.
+
+        This is called in a background thread when a snippet that uses this
+        variable is offered in the autocomplete panel, so that values which
+        are slow to produce are ready if the snippet is picked. The values are
+        only used if the snippet expands within a few seconds; otherwise
+        expand() is called as usual.
+
+        The base class version returns None.
+        """
+        return None
+
+
     def variables(self, content):
         """
         Given a parsed snippet body, return back a dictionary of variables and
@@ -48,10 +186,16 @@ class EnhancedSnippetBase():
         depending on wether or not this enhancement requires changes in order
         to expand out the variable properly or not.
 
-        The base class version returns no variables and does not modify the
-        snippet content.
+        The base class version compiles the content and then expands it; if
+        this enhancement does not support being compiled, it returns no
+        variables and does not modify the snippet content.
         """
-        return dict(), content
+        compiled = self.compile(content)
+        if compiled is None:
+            return dict(), content
+
+        slots, content = compiled
+        return self.expand(slots), content
 
 
 ## ----------------------------------------------------------------------------
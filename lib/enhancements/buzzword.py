@@ -172,33 +172,39 @@ class InsertBuzzwordSnippet(EnhancedSnippetBase):
         return 'BUZZWORD'
 
 
-    def variables(self, content):
+    def default_slots(self):
         """
         The only variable that we support is a BUZZWORD, which inserts a
-        corporate buzzword lorem into the snippet.
-
-        This will potentially rewrite the content of the snippet and export
-        many variables, once for each of the mentions of the variable in the
-        snippet, so that there can be multiple insertions.
+        corporate buzzword lorem into the snippet; slots are only added as the
+        uses of the variable are found.
         """
-        variables = {}
+        return {}
 
-        def add_variable(match):
-            fmt = match.group(1)
 
-            try:
-                count = int(fmt[1:]) or 1
-            except:
-                count = 1
+    def rewrite(self, default, slots):
+        """
+        Every use of the variable is rewritten to use its own variable, so that
+        there can be multiple insertions; the slot for each variable is the
+        number of sentences to generate.
+        """
+        try:
+            count = int(default[1:]) or 1
+        except:
+            count = 1
 
-            var = f"BUZZWORD_{len(variables)}"
-            variables[var] = "\n".join(wrap(create_ipsum(count), width=80))
+        var = f"BUZZWORD_{len(slots)}"
+        slots[var] = count
 
-            return f'${{{var}}}'
+        return f'${{{var}}}'
 
-        content = self.regex.sub(add_variable, content)
-        return variables, content
 
+    def expand(self, slots):
+        """
+        Generate a new lorem for every variable, each of which has the number
+        of sentences that the slot calls for.
+        """
+        return {var: "\n".join(wrap(create_ipsum(count), width=80))
+                for var, count in slots.items()}
 
 
 ## ----------------------------------------------------------------------------
@@ -17,16 +17,24 @@ class InsertClipboardSnippet(EnhancedSnippetBase):
         return 'CLIPBOARD'
 
 
-    def variables(self, content):
+    def default_slots(self):
         """
         The only variable that we support is a CLIPBOARD, which inserts the
-        current clipboard contents into the snippet, but only if there is
-        actually any clipboard text.
+        current clipboard contents into the snippet; the content of the
+        snippet does not need to change.
+        """
+        return {'CLIPBOARD': None}
+
+
+    def expand(self, slots):
+        """
+        Expand the clipboard variable, but only if there is actually any
+        clipboard text.
         """
         text = sublime.get_clipboard()
         return {
             'CLIPBOARD': text if text != '' else None
-        }, content
+        }
 
 
 ## ----------------------------------------------------------------------------
@@ -1,4 +1,6 @@
 from datetime import datetime
+from time import localtime
+import re
 
 from .base import EnhancedSnippetBase
 
@@ -6,6 +8,21 @@ from .base import EnhancedSnippetBase
 ## ----------------------------------------------------------------------------
 
 
+# Date format directives that produce a value which changes more often than
+# once a minute (seconds, microseconds, or a full time or timestamp); dates
+# with these formats are never memoized.
+_SECONDS_DIRECTIVE = re.compile(r'%[-_0^#]?[cfrsSTX+]')
+
+# Date format directives that produce a value which changes every minute or
+# every hour; dates with these formats are memoized only within the same
+# minute or hour, and all others only within the same day.
+_MINUTE_DIRECTIVE = re.compile(r'%[-_0^#]?[MR]')
+_HOUR_DIRECTIVE = re.compile(r'%[-_0^#]?[HIklpP]')
+
+
+## ----------------------------------------------------------------------------
+
+
 class InsertDateSnippet(EnhancedSnippetBase):
     """
     This snippet enhancement class provides the ability to expand out variables
@@ -16,34 +33,71 @@ class InsertDateSnippet(EnhancedSnippetBase):
         return 'DATE'
 
 
-    def variables(self, content):
+    def default_slots(self):
         """
         The only variable that we support is a DATE, which inserts the current
-        date into the snippet.
-
-        This will potentially rewrite the content of the snippet and export
-        many variables, one for each of the distinct date formats that were
-        provided.
+        date into the snippet using a default format.
         """
-        today = datetime.today()
-        variables = {
-            'DATE': today.strftime('%x')
+        return {
+            'DATE': '%x'
         }
 
-        def add_variable(match):
-            # TODO: This should check and see if a format is reused and if so
-            # just reuse the same variable instead of making a new one for
-            # each.
-            fmt = match.group(1)
-            var = 'DATE'
-            if fmt is not None and fmt != ':':
-                var = f"DATE_{len(variables)}"
-                variables[var] = today.strftime(fmt[1:])
 
-            return f'${{{var}}}'
+    def rewrite(self, default, slots):
+        """
+        Each use of the variable with a date format is rewritten to use its own
+        variable, whose slot is that format; distinct formats only need a single
+        variable no matter how many times they are used.
+        """
+        if default is None or default == ':':
+            return '${DATE}'
+
+        fmt = default[1:]
+        var = next((var for var, value in slots.items()
+                    if var != 'DATE' and value == fmt), None)
+        if var is None:
+            var = f"DATE_{len(slots)}"
+            slots[var] = fmt
+
+        return f'${{{var}}}'
+
 
-        content = self.regex.sub(add_variable, content)
-        return variables, content
+    def memo_ttl(self):
+        """
+        Dates are memoized for a second, so that snippets that expand many times
+        in a row (such as from a macro) don't recalculate the same dates.
+        """
+        return 1
+
+
+    def memo_key(self, variable, slot):
+        """
+        The key for each variable is its date format and the current local time
+        to the finest unit that the format displays, so that a memoized date is
+        never used once that unit has rolled over. Formats that include the
+        seconds are not memoized, since they would otherwise be frozen.
+        """
+        fmt = slot.replace('%%', '')
+        if _SECONDS_DIRECTIVE.search(fmt):
+            return None
+
+        if _MINUTE_DIRECTIVE.search(fmt):
+            size = 5
+        elif _HOUR_DIRECTIVE.search(fmt):
+            size = 4
+        else:
+            size = 3
+
+        return (slot, tuple(localtime())[:size])
+
+
+    def expand(self, slots):
+        """
+        Expand every date variable using the same moment in time, so that all
+        of the dates in a snippet agree with each other.
+        """
+        today = datetime.today()
+        return {var: today.strftime(fmt) for var, fmt in slots.items()}
 
 
 ## ----------------------------------------------------------------------------
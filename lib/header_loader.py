@@ -0,0 +1,319 @@
+import re
+
+from EnhancedSnippets.yaml.resolver import Resolver
+
+
+## ----------------------------------------------------------------------------
+
+
+# The implicit resolvers that YAML uses to decide what type a plain (unquoted)
+# scalar has; the keys are the first character of the scalar, and the values
+# are lists of (tag, regex) tuples. Plain scalars that match any of these are
+# not strings.
+_resolvers = Resolver.yaml_implicit_resolvers
+
+# Plain scalars that match this are integers that we can convert directly;
+# other integer forms (octal, hex, sexagesimal, etc) are left to YAML.
+_int_regex = re.compile(r'^[-+]?(?:0|[1-9][0-9]*)$')
+
+# The regex that matches a mapping key and the (optional) value that follows
+# it on the same line.
+_key_regex = re.compile(r'^([A-Za-z_][A-Za-z0-9_-]*):(?: +(.*))?$')
+
+# Characters which, when they start a plain scalar, mean that it's not a plain
+# scalar at all, and the characters that can only start a plain scalar when
+# they are not followed by whitespace.
+_indicators = ',[]{}#&*!|>\'"%@`'
+_space_indicators = '-?:'
+
+# The escape sequences we know how to handle in double quoted strings.
+_escapes = {'\\': '\\', '"': '"', '/': '/', 'n': '\n', 't': '\t'}
+
+# Whitespace other than a space or a newline, such as tabs, non-breaking
+# spaces and the characters that YAML or Python consider to be line breaks;
+# YAML treats these differently than spaces, so headers that contain any are
+# left to it.
+_other_whitespace = re.compile(r'[^\S \n]')
+
+
+## ----------------------------------------------------------------------------
+
+
+class _Unsupported(Exception):
+    """
+    Raised internally when the header uses YAML outside of the subset that this
+    loader knows how to parse.
+    """
+    pass
+
+
+## ----------------------------------------------------------------------------
+
+
+def _resolves_to_string(value):
+    """
+    Given the text of a plain scalar, return an indication of whether YAML
+    would treat it as a string or as some other type.
+    """
+    for tag, regex in _resolvers.get(value[:1] or None, []):
+        if regex.match(value):
+            return False
+
+    return True
+
+
+def _plain_scalar(text):
+    """
+    Given the text of a plain scalar that appears on a single line (possibly
+    followed by a comment), return the value of that scalar.
+    """
+    # A comment starts at a '#' that follows whitespace.
+    pos = text.find(' #')
+    if pos >= 0:
+        text = text[:pos]
+    text = text.rstrip(' ')
+
+    if (not text or text[0] in _indicators or
+            (text[0] in _space_indicators and text[1:2] in ('', ' '))):
+        raise _Unsupported()
+
+    # Anything that might be a nested mapping, or a continuation that we're
+    # not equipped to handle, falls back to YAML.
+    if ': ' in text or text.endswith(':'):
+        raise _Unsupported()
+
+    if _resolves_to_string(text):
+        return text
+
+    if _int_regex.match(text):
+        return int(text)
+
+    raise _Unsupported()
+
+
+def _quoted_scalar(text):
+    """
+    Given the text of a single or double quoted scalar that appears on a single
+    line (possibly followed by a comment), return the value of that scalar.
+    """
+    quote = text[0]
+    result = []
+    pos = 1
+    while True:
+        end = text.find(quote, pos) if quote == "'" else _dquote_end(text, pos)
+        if end < 0:
+            raise _Unsupported()
+
+        result.append(text[pos:end])
+        pos = end + 1
+
+        # In single quoted strings, a doubled quote is an escaped quote.
+        if quote == "'" and text[pos:pos + 1] == "'":
+            result.append("'")
+            pos += 1
+            continue
+
+        break
+
+    # Whatever follows the closing quote can only be a comment.
+    rest = text[pos:].strip(' ')
+    if rest and not rest.startswith('#'):
+        raise _Unsupported()
+
+    value = ''.join(result)
+    return _unescape(value) if quote == '"' else value
+
+
+def _dquote_end(text, pos):
+    """
+    Find the position of the closing quote of a double quoted string, skipping
+    over any escaped quotes.
+    """
+    while pos < len(text):
+        if text[pos] == '\\':
+            pos += 2
+        elif text[pos] == '"':
+            return pos
+        else:
+            pos += 1
+
+    return -1
+
+
+def _unescape(value):
+    """
+    Handle the escape sequences in the content of a double quoted string.
+    """
+    if '\\' not in value:
+        return value
+
+    result = []
+    pos = 0
+    while pos < len(value):
+        char = value[pos]
+        if char == '\\':
+            char = _escapes.get(value[pos + 1:pos + 2])
+            if char is None:
+                raise _Unsupported()
+            pos += 1
+
+        result.append(char)
+        pos += 1
+
+    return ''.join(result)
+
+
+def _scalar(text):
+    """
+    Given the text of a scalar value on a single line, return the value.
+    """
+    if text[0] in ('"', "'"):
+        return _quoted_scalar(text)
+
+    return _plain_scalar(text)
+
+
+## ----------------------------------------------------------------------------
+
+
+def _parse_block(lines, idx, indent):
+    """
+    Parse the block (either a mapping or a sequence) that starts at the given
+    line index, whose items are at the given indent. Returns the value and the
+    index of the first line past the end of the block.
+    """
+    if lines[idx][1].startswith('-'):
+        return _parse_sequence(lines, idx, indent)
+
+    return _parse_mapping(lines, idx, indent)
+
+
+def _parse_nested(lines, idx, indent):
+    """
+    Parse the nested block that is the value of a mapping key whose value is
+    not on the same line, where the key is at the given indent. The line index
+    is the line following the key.
+    """
+    if idx < len(lines):
+        child_indent, text = lines[idx]
+
+        # Sequences are allowed to be at the same indent as their key.
+        if (child_indent > indent or
+                (child_indent == indent and text.startswith('- '))):
+            return _parse_block(lines, idx, child_indent)
+
+    # An empty value is a null, which is not something the snippet schema
+    # wants; let YAML deal with it.
+    raise _Unsupported()
+
+
+def _parse_mapping(lines, idx, indent):
+    """
+    Parse the block mapping whose keys are at the given indent, starting at
+    the given line index. Returns the dictionary and the index of the first
+    line past the end of the mapping.
+    """
+    result = {}
+    while idx < len(lines):
+        line_indent, text = lines[idx]
+        if line_indent < indent:
+            break
+
+        if line_indent > indent:
+            raise _Unsupported()
+
+        match = _key_regex.match(text)
+        if match is None:
+            raise _Unsupported()
+
+        key, value = match.groups()
+        if key in result or not _resolves_to_string(key):
+            raise _Unsupported()
+
+        idx += 1
+        if value is None or value.startswith('#'):
+            result[key], idx = _parse_nested(lines, idx, indent)
+        else:
+            result[key] = _scalar(value)
+
+    return result, idx
+
+
+def _parse_sequence(lines, idx, indent):
+    """
+    Parse the block sequence whose items are at the given indent, starting at
+    the given line index. The items can be scalars or mappings. Returns the
+    list and the index of the first line past the end of the sequence.
+    """
+    result = []
+    while idx < len(lines):
+        line_indent, text = lines[idx]
+        if line_indent < indent:
+            break
+
+        if line_indent > indent or not text.startswith('- '):
+            # A sequence that is the value of a mapping key at the same indent
+            # ends when the next key starts.
+            if line_indent == indent and not text.startswith('-'):
+                break
+            raise _Unsupported()
+
+        # Determine where the content of the item starts; if it's a mapping,
+        # the keys of that mapping are lined up at that column.
+        item = text[2:].lstrip(' ')
+        column = line_indent + len(text) - len(item)
+        if not item or item.startswith('#') or item.startswith('-'):
+            raise _Unsupported()
+
+        if _key_regex.match(item):
+            lines[idx] = (column, item)
+            value, idx = _parse_mapping(lines, idx, column)
+        else:
+            value = _scalar(item)
+            idx += 1
+
+        result.append(value)
+
+    return result, idx
+
+
+## ----------------------------------------------------------------------------
+
+
+def load_snippet_header(text):
+    """
+    Given the YAML front matter from a snippet, attempt to parse it using a
+    loader that understands only the small subset of YAML that snippet headers
+    need: a mapping of keys to single line scalars, block sequences and block
+    mappings, and comments.
+
+    The result is the same dictionary that YAML would produce. If the header
+    uses anything outside of the supported subset, None is returned and the
+    caller should use the full YAML loader instead.
+    """
+    if _other_whitespace.search(text):
+        return None
+
+    lines = []
+    for line in text.split('\n'):
+        stripped = line.lstrip(' ')
+        if not stripped or stripped.startswith('#'):
+            continue
+
+        lines.append((len(line) - len(stripped), stripped.rstrip(' ')))
+
+    if not lines:
+        return {}
+
+    try:
+        if lines[0][0] != 0:
+            return None
+
+        result, idx = _parse_mapping(lines, 0, 0)
+        return result if idx == len(lines) else None
+
+    except _Unsupported:
+        return None
+
+
+## ----------------------------------------------------------------------------
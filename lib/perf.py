@@ -0,0 +1,180 @@
+from collections import deque
+from contextlib import contextmanager
+from math import ceil
+from threading import Lock
+from time import perf_counter
+
+
+## ----------------------------------------------------------------------------
+
+
+# The number of most recent timings that are kept for each timer, which is what
+# the percentiles are calculated from.
+_sample_count = 1024
+
+# All of the timers and counters that have been recorded so far, keyed by name.
+_timers = {}
+_counters = {}
+
+# Timings can be recorded from background threads (such as while scanning with
+# worker threads), so updates are protected by this lock.
+_lock = Lock()
+
+
+## ----------------------------------------------------------------------------
+
+
+class _Timer():
+    """
+    Instances of this class track the details of all of the times that some
+    particular operation was timed, both overall and broken down by the package
+    that the operation was for (when that is known).
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=_sample_count)
+
+        # The keys are package names, and the values are lists that contain the
+        # count, total time and maximum time for that package.
+        self.packages = {}
+
+
+    def add(self, elapsed, pkg):
+        """
+        Add a single timing of the given number of seconds, optionally
+        associating it with the given package.
+        """
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.samples.append(elapsed)
+
+        if pkg is not None:
+            entry = self.packages.setdefault(pkg, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] = max(entry[2], elapsed)
+
+
+    def summary(self):
+        """
+        Return back a dictionary that summarizes this timer; all times are in
+        milliseconds.
+        """
+        # Percentiles use the nearest rank method; the sample chosen is the
+        # smallest one that at least the given fraction of samples are no
+        # larger than.
+        samples = sorted(self.samples)
+        def percentile(pct):
+            return samples[max(0, ceil(len(samples) * pct) - 1)] * 1000
+
+        return {
+            'count': self.count,
+            'total_ms': self.total * 1000,
+            'mean_ms': self.total / self.count * 1000,
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'max_ms': self.max * 1000,
+            'packages': {
+                pkg: {'count': count, 'total_ms': total * 1000, 'max_ms': max_time * 1000}
+                for pkg, (count, total, max_time) in sorted(self.packages.items())
+            }
+        }
+
+
+## ----------------------------------------------------------------------------
+
+
+def record(name, elapsed, pkg=None):
+    """
+    Record that the operation with the given name took the given number of
+    seconds, optionally associating the time with the given package.
+    """
+    with _lock:
+        timer = _timers.get(name)
+        if timer is None:
+            timer = _timers[name] = _Timer()
+
+        timer.add(elapsed, pkg)
+
+
+@contextmanager
+def timed(name, pkg=None):
+    """
+    A context manager that records how long the code in its body took to run,
+    as a timing for the operation with the given name.
+    """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        record(name, perf_counter() - start, pkg)
+
+
+def increment(name, amount=1):
+    """
+    Increment the counter with the given name by the given amount.
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def reset():
+    """
+    Throw away all of the timings and counters that have been collected.
+    """
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+
+
+def snapshot():
+    """
+    Return back a dictionary that contains a summary of all of the timers and
+    counters collected so far; this can be encoded as JSON.
+    """
+    with _lock:
+        return {
+            'timers': {name: timer.summary() for name, timer in sorted(_timers.items())},
+            'counters': dict(sorted(_counters.items()))
+        }
+
+
+def format_stats(stats):
+    """
+    Given a snapshot of the statistics, return back a textual report of them
+    suitable for display.
+    """
+    lines = []
+    row = '{:<24} {:>8} {:>12} {:>10} {:>10} {:>10} {:>10}'
+    lines.append(row.format('timer', 'count', 'total ms', 'mean ms', 'p50 ms', 'p95 ms', 'max ms'))
+    lines.append('-' * 90)
+    for name, info in stats['timers'].items():
+        lines.append(row.format(name, info['count'], f"{info['total_ms']:.2f}",
+                                f"{info['mean_ms']:.3f}", f"{info['p50_ms']:.3f}",
+                                f"{info['p95_ms']:.3f}", f"{info['max_ms']:.3f}"))
+
+    if stats['counters']:
+        lines.extend(['', '{:<24} {:>8}'.format('counter', 'value'), '-' * 33])
+        for name, value in stats['counters'].items():
+            lines.append('{:<24} {:>8}'.format(name, value))
+
+    # Display the timers that have a package breakdown, with the packages
+    # that took the most time first.
+    for name, info in stats['timers'].items():
+        if not info['packages']:
+            continue
+
+        lines.extend(['', f'{name} by package:'])
+        lines.append('  {:<40} {:>8} {:>12} {:>10}'.format('package', 'count', 'total ms', 'max ms'))
+        packages = sorted(info['packages'].items(), key=lambda item: -item[1]['total_ms'])
+        for pkg, pkg_info in packages:
+            lines.append('  {:<40} {:>8} {:>12} {:>10}'.format(
+                pkg, pkg_info['count'], f"{pkg_info['total_ms']:.2f}", f"{pkg_info['max_ms']:.3f}"))
+
+    return '\n'.join(lines) + '\n'
+
+
+## ----------------------------------------------------------------------------
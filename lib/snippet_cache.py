@@ -0,0 +1,247 @@
+import sublime
+
+from hashlib import sha1
+from os import makedirs, replace, unlink
+from os.path import join
+from time import perf_counter
+import json
+
+from .utils import log, debug, Snippet
+
+
+## ----------------------------------------------------------------------------
+
+
+# The name of the file (in our cache folder) that the parsed snippet records
+# are persisted into between sessions.
+_cache_file = 'snippet_cache.json'
+
+# The version of the format of the data in the cache file. This needs to be
+# bumped every time the layout of the cache changes, or any time that the way
+# that snippets are parsed changes in a way that would alter the records that
+# are produced; a cache with a different version is ignored when loading.
+_cache_version = 1
+
+# How long (in milliseconds) to wait before writing the cache to disk after it
+# changes. Writing the cache means encoding all of it, so changes to only a
+# few snippets (such as when one is edited) wait much longer, so that a run of
+# them is written out at once.
+_save_delay = 500
+_minor_save_delay = 30000
+
+
+## ----------------------------------------------------------------------------
+
+
+def resource_digest(data):
+    """
+    Given the textual content of a snippet resource, return back a hash of
+    that content that can be used to determine if the resource has changed
+    since it was last parsed.
+    """
+    return sha1(data.encode('utf-8')).hexdigest()
+
+
+## ----------------------------------------------------------------------------
+
+
+class SnippetCache():
+    """
+    Instances of this class maintain a persistent, on disk cache of snippet
+    records that have been parsed from snippet resources. Each record is
+    stored along with a hash of the resource content that it was created from,
+    so that resources that have not changed since the last time they were seen
+    can skip being parsed entirely.
+    """
+    def __init__(self):
+        # The keys in this object are resource names and the values are
+        # dictionaries which contain the digest of the resource content and
+        # the fields of the snippet record that was parsed out of it.
+        self._entries = {}
+
+        # Set whenever the in memory version of the cache has changes that
+        # have not yet been persisted. Every scheduled save gets a new token,
+        # and only the save with the most recent token writes; the time that
+        # the save is due is None when no save is scheduled.
+        self._dirty = False
+        self._save_token = 0
+        self._save_due = None
+
+        # Set when the cache was successfully loaded from disk.
+        self.loaded = False
+
+        self.load()
+
+
+    def _filename(self):
+        """
+        Return back the full path to the file that is used to store our cache
+        data between sessions.
+        """
+        pkg_name = __name__.split('.')[0]
+        return join(sublime.cache_path(), pkg_name, _cache_file)
+
+
+    def load(self):
+        """
+        Load the contents of the cache from disk, replacing any data that is
+        currently being held. If there is no cache or it can't be loaded, the
+        cache is left empty.
+        """
+        self._entries = {}
+        self._dirty = False
+        self.loaded = False
+
+        try:
+            with open(self._filename(), 'rt', encoding='utf-8') as file:
+                data = json.load(file)
+
+            if data.get('version') != _cache_version:
+                return log('snippet cache is from a different version; ignoring it')
+
+            self._entries = data.get('snippets', {})
+            self.loaded = True
+            debug('loaded %d cached snippet records', len(self._entries))
+
+        except FileNotFoundError:
+            pass
+
+        except Exception as error:
+            log(f'unable to load the snippet cache: {str(error)}')
+
+
+    def save(self, minor=False):
+        """
+        Schedule a write of the cache to disk if there are any changes in it
+        that have not been persisted yet. The write happens in the background;
+        multiple calls prior to the write happening will only write once.
+
+        Minor changes (such as a single snippet being reloaded) wait for much
+        longer before they are written, unless a call for a change that is not
+        minor happens in the meantime.
+        """
+        if not self._dirty:
+            return
+
+        delay = _minor_save_delay if minor else _save_delay
+        due = perf_counter() + delay / 1000
+        if self._save_due is not None and self._save_due <= due:
+            return
+
+        self._save_token += 1
+        self._save_due = due
+        token = self._save_token
+        sublime.set_timeout_async(lambda: self.__write_cache(token), delay)
+
+
+    def __write_cache(self, token):
+        """
+        Persist the current contents of the cache to disk, if the save with
+        the given token is still the most recent one; this should not be
+        called directly, use save() instead.
+
+        The file is written to a temporary name first and then moved into place
+        so that an interrupted write can't leave a truncated cache behind.
+        """
+        if token != self._save_token or self._save_due is None:
+            return
+
+        self._save_due = None
+        self._dirty = False
+
+        # The entries in the cache are never modified in place, only replaced,
+        # so a shallow copy is enough to protect the write from changes that
+        # happen in the main thread while we're encoding. The data is encoded
+        # all at once rather than streamed into the file, since that's much
+        # faster.
+        entries = dict(self._entries)
+        data = json.dumps({'version': _cache_version, 'snippets': entries})
+
+        filename = self._filename()
+        temp_name = f'{filename}.tmp'
+        try:
+            makedirs(join(sublime.cache_path(), __name__.split('.')[0]),
+                     mode=0o777, exist_ok=True)
+            with open(temp_name, 'wt', encoding='utf-8') as file:
+                file.write(data)
+
+            replace(temp_name, filename)
+            debug('wrote %d snippet records to the snippet cache', len(entries))
+
+        except Exception as error:
+            log(f'unable to save the snippet cache: {str(error)}')
+            try:
+                unlink(temp_name)
+            except OSError:
+                pass
+
+
+    def lookup(self, res_name, digest):
+        """
+        Given the name of a snippet resource and the digest of its current
+        content, return back the snippet record that was cached for it, if
+        any. None is returned if the resource is not cached or if the cached
+        version was created from different content.
+        """
+        entry = self._entries.get(res_name)
+        if entry is None or entry['digest'] != digest:
+            return None
+
+        return Snippet(**entry['snippet'])
+
+
+    def scope(self, res_name):
+        """
+        Given the name of a snippet resource, return back the scope selector
+        of the snippet that was cached for it, if any; this may not reflect the
+        current content of the resource.
+        """
+        entry = self._entries.get(res_name)
+        return None if entry is None else entry['snippet']['scope']
+
+
+    def manifest(self):
+        """
+        Return back a manifest of the resources in the cache; this is a
+        dictionary whose keys are resource names and whose values are tuples
+        that contain the digest of the resource and the package it's in.
+        """
+        return {res_name: (entry['digest'], entry['snippet']['package'])
+                for res_name, entry in self._entries.items()}
+
+
+    def store(self, res_name, digest, snippet):
+        """
+        Store the given snippet record into the cache, associated with the
+        resource it came from and the digest of the content it was parsed
+        from.
+        """
+        self._entries[res_name] = {
+            'digest': digest,
+            'snippet': snippet._asdict()
+        }
+        self._dirty = True
+
+
+    def discard(self, res_name):
+        """
+        Remove the given resource from the cache, if it's present.
+        """
+        if self._entries.pop(res_name, None) is not None:
+            self._dirty = True
+
+
+    def prune(self, res_names, prefix=''):
+        """
+        Given a set of resource names, remove from the cache all entries whose
+        resource names start with the given prefix that do not appear in the
+        set. This is used after a scan to drop records for resources that no
+        longer exist.
+        """
+        for res_name in list(self._entries.keys()):
+            if res_name.startswith(prefix) and res_name not in res_names:
+                del self._entries[res_name]
+                self._dirty = True
+
+
+## ----------------------------------------------------------------------------
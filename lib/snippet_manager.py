@@ -1,12 +1,20 @@
 import sublime
 
-from collections import Counter
-from os import makedirs, unlink
-from os.path import basename, join, isfile
+from concurrent.futures import ThreadPoolExecutor
+from os import listdir, makedirs, replace, unlink
+from os.path import basename, join, isfile, normcase
 import functools
-from fnmatch import fnmatch
+import time
+from fnmatch import translate
+from itertools import chain
+from threading import Lock
+import re
 
-from .utils import log, debug, load_snippet
+from .utils import log, debug, snippet_from_resource, snippet_completion
+from .utils import compile_expansion_plan, snippet_option_items
+from .utils import SnippetHandler
+from .snippet_cache import SnippetCache, resource_digest
+from . import perf
 
 
 ## ----------------------------------------------------------------------------
@@ -20,24 +28,79 @@ _cmd_file_prefix = 'UserSnippets_'
 ## ----------------------------------------------------------------------------
 
 
-def _get_list(data_dict, key):
+def _get_entries(data_dict, key):
     """
-    Given a data dictionary, return back the list at the given key; if there is
-    no such key, a list will be added before the return.
+    Given a data dictionary, return back the dictionary of snippets (keyed by
+    resource name) at the given key; if there is no such key, an empty one
+    will be added before the return.
     """
     if key not in data_dict:
-        data_dict[key] = []
+        data_dict[key] = {}
 
     return data_dict[key]
 
 
-def _filter(res_name, items):
+def _discard_entry(data_dict, key, res_name):
     """
-    Given a list of snippets and a resource name, remove from the list any
-    snippet which matches that particular resource name, returning back the
-    modified list.
+    Given a data dictionary, remove the snippet with the given resource name
+    from the dictionary of snippets at the given key, removing the key
+    entirely if that leaves it empty. The return value indicates whether the
+    key was removed.
     """
-    return list(filter(lambda snippet: snippet.resource != res_name, items))
+    entries = data_dict.get(key)
+    if entries is None:
+        return False
+
+    entries.pop(res_name, None)
+    if entries:
+        return False
+
+    del data_dict[key]
+    return True
+
+
+def _trigger_key(trigger):
+    """
+    Given the tab trigger of a snippet (or the prefix text that is being used
+    to query completions), return back the key in the trigger index that it
+    is associated with.
+
+    The autocomplete panel matches completions fuzzily but case insensitively,
+    and only when the first character of what was typed matches the first
+    character of the trigger, so the key is the lower cased first character.
+    Triggers that are empty or which start with a non-word character (which
+    the completion prefix never contains) use the empty string as a key, so
+    that they are considered for every completion request.
+    """
+    if not trigger or not (trigger[0].isalnum() or trigger[0] == '_'):
+        return ''
+
+    return trigger[0].lower()
+
+
+@functools.lru_cache(maxsize=4096)
+def _selector_matches(scope_name, selector):
+    """
+    Given the full scope name at some location and a scope selector, return
+    True or False to indicate whether that selector matches that scope.
+
+    This is the same check that view.match_selector() does, but the results
+    are cached since the same handful of selectors tend to be tested against
+    the same handful of scopes over and over while typing.
+    """
+    return sublime.score_selector(scope_name, selector) > 0
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_glob(glob):
+    """
+    Given a filename glob, return back a function that can be invoked with a
+    (normalized) filename to determine if that filename matches the glob.
+
+    This matches using the same rules as fnmatch(), but the glob only needs to
+    be translated into a regular expression once.
+    """
+    return re.compile(translate(normcase(glob))).match
 
 
 ## ----------------------------------------------------------------------------
@@ -53,7 +116,6 @@ class SnippetManager():
     methods that track the internal instance so you don't have to.
     """
     instance = None
-    pending_writes = Counter()
 
     def __init__(self, listener, enhancements):
         if SnippetManager.instance is not None:
@@ -62,12 +124,63 @@ class SnippetManager():
         SnippetManager.instance = self
         self.enhancements = enhancements
 
+        # The persistent cache of parsed snippets; snippets whose resource
+        # content has not changed since they were cached are not re-parsed.
+        self.cache = SnippetCache()
+
+        debug('snippet headers are parsed with %s when needed', SnippetHandler.LOADER.__name__)
+
+        # The manifest of snippets as they were at the end of the last session;
+        # full scans compare against this to know what changed while we were
+        # not running, until one of them completes. This is None if there was
+        # no cache to tell us.
+        self._last_session = self.cache.manifest() if self.cache.loaded else None
+        self._session_scanned = False
+
+        # Whether the completion items that we create for snippets should say
+        # that they are enhanced snippets in their details.
+        from ..src.core import es_setting
+        self._use_details = es_setting('use_details')
+
+        # The packages whose sublime-commands files need to be regenerated,
+        # and whether a write of them has been scheduled; the lock protects
+        # both, since the write happens in the background.
+        self._pending_cmd_files = set()
+        self._cmd_write_scheduled = False
+        self._cmd_lock = Lock()
+
+        # For each package that has a sublime-commands file, the digest of the
+        # content that it was last known to contain.
+        self._cmd_digests = {}
+
+        # Every scan gets a new identifier; scans that happen in the background
+        # use this to know if their results are still needed when they finish.
+        # The scan identifiers dictionary tracks the most recent scan for each
+        # prefix, with an empty prefix being a full scan.
+        self._scan_id = 0
+        self._scan_ids = {}
+
+        # The time at which the most recent scan of each prefix started, so
+        # that the total time of the scan can be recorded when it's finished.
+        self._scan_started = {}
+
+        # Whether the snippets are still being loaded (in which case the lists
+        # only contain some of them) or whether they're all ready; callbacks
+        # registered with on_ready() are called when a full scan completes.
+        self.state = 'loading'
+        self._ready_callbacks = []
+
         # Listen for settings changing, so we know when we need to drop or scan
         # for snippets.
         listener.add_listener(lambda a,r: self._settings_change(a, r))
 
-        # Scan for all enhanced snippets; this will do an implicit discard,
-        # which has the effect of initializing the snippet control structures.
+        # Listen for enhancements changing, so we know when the snippets that
+        # use them need to have their expansion plans recreated.
+        enhancements.add_listener(lambda names: self._enhancements_change(names))
+
+        # Initialize the snippet control structures, then scan for all of the
+        # enhanced snippets.
+        self.discard_all(quiet=True)
         self.scan()
 
 
@@ -77,7 +190,7 @@ class SnippetManager():
         tell us which packages were added to the setting and which were removed
         from it.
         """
-        debug(f"ignored packages => added: {str(added)} removed: {str(removed)}")
+        debug("ignored packages => added: %s removed: %s", added, removed)
 
         def perform_package_reload():
             for pkg in added:
@@ -94,25 +207,44 @@ class SnippetManager():
         sublime.set_timeout(perform_package_reload, 1000)
 
 
-    def discard_old_cmd_files(self):
+    def _enhancements_change(self, names):
         """
-        This will find all of the sublime-commands files that this package may
-        have ever generated out and remove all of them. This gets triggered
-        whenever a full rescan is requested, which can occur both manually as
-        well as automatically at startup.
+        This gets invoked whenever the enhancements that provide any variables
+        are added, replaced or removed, to tell us the names of the variables
+        that changed. Only the snippets that use those variables need to have
+        their expansion plans recreated.
         """
-        pkg_name = __name__.split('.')[0]
-        pkg_cache = join(sublime.cache_path(), pkg_name)
+        affected = {}
+        for name in names:
+            affected.update(self._var_list.get(name, {}))
 
-        res = [join(pkg_cache, basename(r)) for r in sublime.find_resources('*.sublime-commands')
-                 if r.startswith(f'Cache/{pkg_name}/{_cmd_file_prefix}')]
+        debug("enhancements changed for %s; updating %d snippet(s)", names, len(affected))
+        for res, snippet in affected.items():
+            self._plans[res] = self.__compile_plan(snippet)
 
-        for cmd_file in res:
-            log(f"removing old commands file: '{basename(cmd_file)}'")
-            try:
-                unlink(cmd_file)
-            except Exception as error:
-                log(f"error removing file: {str(error)}")
+
+    def _cmd_file_folder(self):
+        """
+        Return back the folder that our generated sublime-commands files are
+        stored in.
+        """
+        return join(sublime.cache_path(), __name__.split('.')[0])
+
+
+    def _cmd_file_packages(self):
+        """
+        Return back the set of the names of all packages for which there is
+        currently a sublime-commands file on disk that we generated at some
+        point, possibly in a prior session.
+        """
+        try:
+            files = listdir(self._cmd_file_folder())
+        except OSError:
+            return set()
+
+        suffix = '.sublime-commands'
+        return {name[len(_cmd_file_prefix):-len(suffix)] for name in files
+                if name.startswith(_cmd_file_prefix) and name.endswith(suffix)}
 
 
     def rewrite_commands_file(self, pkg_set):
@@ -125,27 +257,57 @@ class SnippetManager():
         If any packages in the list no longer have snippets in them, any file
         that may have existed will be deleted.
 
-        This uses a debounce so that if it is called multiple times in quick
-        succession the write will only happen once for any given package in the
-        set.
+        This coalesces requests; if it is called multiple times before the
+        write happens, all of the packages from all of the calls are handled
+        by a single write.
         """
-        for pkg in pkg_set:
-            self.pending_writes[pkg] += 1
-            sublime.set_timeout_async(functools.partial(self.__generate_commands_file, pkg), 500)
+        if not pkg_set:
+            return
+
+        with self._cmd_lock:
+            self._pending_cmd_files.update(pkg_set)
+            if self._cmd_write_scheduled:
+                return
+
+            self._cmd_write_scheduled = True
 
+        sublime.set_timeout_async(self.__write_commands_files, 500)
 
-    def __generate_commands_file(self, rewrite_pkg_name):
+
+    def __write_commands_files(self):
         """
-        Iterates over all of the currently known and loaded snippets and
-        generates out a sublime-commands file that contains an entry for them.
+        Generate the sublime-commands file for all of the packages that are
+        waiting for one.
 
-        This uses a debounce and should not be called directly; use the
-        rewrite_commands_file() function instead to schedule the write.
+        This should not be called directly; use the rewrite_commands_file()
+        function instead to schedule the write.
         """
-        self.pending_writes[rewrite_pkg_name] -= 1
-        if self.pending_writes[rewrite_pkg_name] != 0:
-            return
+        with self._cmd_lock:
+            pending = self._pending_cmd_files
+            self._pending_cmd_files = set()
+            self._cmd_write_scheduled = False
+
+        # Ensure that the folder we're about to put files in exists;
+        # potentially on an initial install the plugin will load prior to the
+        # cache folder being set up to store the syntax cache, in which case
+        # the writes would fail.
+        file_folder = self._cmd_file_folder()
+        makedirs(file_folder, mode=0o777, exist_ok=True)
+
+        for pkg in sorted(pending):
+            try:
+                with perf.timed('commands_file', pkg):
+                    self.__generate_commands_file(file_folder, pkg)
+            except Exception as error:
+                log(f"error writing sublime-commands file for package {pkg}: {str(error)}")
 
+
+    def __generate_commands_file(self, file_folder, rewrite_pkg_name):
+        """
+        Generate out a sublime-commands file in the given folder that contains
+        an entry for each of the currently known snippets in the given package.
+        The file is only written if its content would change.
+        """
         def prepare(snippet):
             # The title is either the description or, if there is not one,
             # the name of the file without an extension.
@@ -163,33 +325,56 @@ class SnippetManager():
                 }
             }
 
-        # Get our package name, then use it to construct a filename at which
-        # to store our commands file.
-        pkg_name = __name__.split('.')[0]
-        file_folder = join(sublime.cache_path(), pkg_name)
         filename = join(file_folder, f'{_cmd_file_prefix}{rewrite_pkg_name}.sublime-commands')
 
-        # Ensure that the folder we're about to put a file in exists;
-        # potentially on an initial install the plugin will load prior to the
-        # cache folder being set up to store the syntax cache, in which case
-        # the below would fail.
-        makedirs(file_folder, mode=0o777, exist_ok=True)
-
         # Create the JSON structure of the sublime-commands file from the list
         # of snippets that are currently loaded; If that is empty, then we can
-        # just leave.
-        data = [prepare(snippet) for snippet in self._res_list.values() if snippet.package == rewrite_pkg_name]
+        # just remove the file and leave. The snippets are sorted so that the
+        # content is stable regardless of the order they were loaded in.
+        snippets = sorted(self._pkg_list.get(rewrite_pkg_name, {}).values(),
+                          key=lambda snippet: snippet.resource)
+        data = [prepare(snippet) for snippet in snippets]
         if not data:
+            self._cmd_digests.pop(rewrite_pkg_name, None)
             try:
-                log(f'removing sublime-commands file for package {rewrite_pkg_name}; it is now empty')
                 unlink(filename)
+                log(f'removed sublime-commands file for package {rewrite_pkg_name}; it is now empty')
             except FileNotFoundError:
                 pass
             return
 
-        debug(f"Writing {len(data)} entries to '{basename(filename)}'")
-        with open(filename, 'wt') as file:
-            file.write(sublime.encode_value(data, True))
+        # If the file already has this content, leave it alone; rewriting it
+        # would make Sublime index it again for no reason. When we don't know
+        # what the file contains, the file on disk is checked.
+        content = sublime.encode_value(data, True)
+        digest = resource_digest(content)
+        if rewrite_pkg_name not in self._cmd_digests:
+            try:
+                with open(filename, 'rt', encoding='utf-8') as file:
+                    self._cmd_digests[rewrite_pkg_name] = resource_digest(file.read())
+            except OSError:
+                pass
+
+        if self._cmd_digests.get(rewrite_pkg_name) == digest:
+            return debug("'%s' is already up to date", basename(filename))
+
+        # Write to a temporary file and then move it into place, so that
+        # Sublime never sees a partially written file.
+        debug("Writing %d entries to '%s'", len(data), basename(filename))
+        temp_name = f'{filename}.tmp'
+        try:
+            with open(temp_name, 'wt', encoding='utf-8') as file:
+                file.write(content)
+
+            replace(temp_name, filename)
+            self._cmd_digests[rewrite_pkg_name] = digest
+
+        except Exception:
+            try:
+                unlink(temp_name)
+            except OSError:
+                pass
+            raise
 
 
     def discard_all(self, quiet=False):
@@ -198,7 +383,7 @@ class SnippetManager():
         this puts everything into a completely clean state.
         """
         if not quiet:
-            debug(f'discarding all snippets')
+            debug('discarding all snippets')
 
         # These lists are all dictionaries wherein the key is the important bit
         # of distinction (scope selector, package name or full resource path)
@@ -206,46 +391,93 @@ class SnippetManager():
         # data.
         #
         # In the case of the scope and package items, the values of the keys
-        # are lists, but in the resource list they're single objects (the
-        # snippet records) since that is a 1:1 relationship.
+        # are dictionaries of snippet records keyed by resource name, so that
+        # a single snippet can be removed without having to rebuild anything;
+        # in the resource list they're single objects (the snippet records)
+        # since that is a 1:1 relationship.
+        #
+        # The trigger list is an index of snippets by the first character of
+        # their tab trigger; see _trigger_key(). The variable list is an index
+        # of snippets by each of the variables that appear in them.
         self._scope_list = {}
         self._pkg_list = {}
+        self._trigger_list = {}
+        self._glob_list = {}
+        self._var_list = {}
         self._res_list = {}
 
+        # For every snippet in the resource list, the digest of the content of
+        # the resource that it was loaded from.
+        self._digests = {}
+
+        # The compiled version of every glob in the glob list.
+        self._glob_regex = {}
 
-    def _discard_snippet_list(self, items):
+        # For each view that we have been asked to match against, the filename
+        # that the view had at the time and the set of globs from the glob
+        # list that match that name. This is thrown away any time the set of
+        # known globs changes.
+        self._view_globs = {}
+
+        # For every snippet in the resource list, the completion item that
+        # represents it in the autocomplete panel. These are created when the
+        # snippet is added, so that completion requests don't need to.
+        self._completions = {}
+
+        # For every snippet in the resource list, the plan for expanding it;
+        # these are also created when the snippet is added.
+        self._plans = {}
+
+        # For every snippet in the resource list that has field options, the
+        # quick panel items for those options, keyed by field number; these
+        # are created when the snippet is added, so that prompting for an
+        # option doesn't need to build the list.
+        self._option_items = {}
+
+
+    def _discard_snippet_list(self, items, rewrite=True):
         """
         Given a list of 0 or more snippet items, remove all snippets in the
         passed in list from all of our internal lists.
+
+        Unless told otherwise, the commands files for the packages that the
+        discarded snippets were in are regenerated.
         """
         discarded = set()
 
         for snippet in [s for s in items if s.resource in self._res_list]:
             discarded.add(snippet.package)
-            debug(f'discarding: {snippet.resource}')
+            debug('discarding: %s', snippet.resource)
 
             res = snippet.resource
             pkg = snippet.package
             scope = snippet.scope
-
-            # Filter the lists to not include this resource
-            self._scope_list[scope] = _filter(res, self._scope_list[scope])
-            self._pkg_list[pkg] = _filter(res, self._pkg_list[pkg])
-
-            # If either list ends up empty, that list doesn't need to be in
-            # the object any longer.
-            if not self._scope_list[scope]:
-                del self._scope_list[scope]
-
-            if not self._pkg_list[pkg]:
-                del self._pkg_list[pkg]
-
-            # Delete the resource based item last.
+            trigger = _trigger_key(snippet.trigger)
+            glob = snippet.glob
+
+            # Remove this resource from each of the lists; any list that ends
+            # up empty is removed from the object entirely. The package list
+            # may already be gone if the whole package is being discarded.
+            _discard_entry(self._scope_list, scope, res)
+            _discard_entry(self._pkg_list, pkg, res)
+            _discard_entry(self._trigger_list, trigger, res)
+            for variable in snippet.variables:
+                _discard_entry(self._var_list, variable, res)
+
+            if _discard_entry(self._glob_list, glob, res):
+                del self._glob_regex[glob]
+                self._view_globs = {}
+
+            # Delete the resource based items last.
             del self._res_list[res]
+            del self._digests[res]
+            del self._completions[res]
+            del self._plans[res]
+            self._option_items.pop(res, None)
 
         # If we discarded any snippets, recreate the commands file so that
         # they will no longer be presented.
-        if discarded:
+        if discarded and rewrite:
             self.rewrite_commands_file(discarded)
 
 
@@ -268,7 +500,7 @@ class SnippetManager():
         result = []
         for scope, snippets in self._scope_list.items():
             if sublime.score_selector(scope, selector):
-                result.extend(snippets)
+                result.extend(snippets.values())
 
         self._discard_snippet_list(result)
 
@@ -281,7 +513,10 @@ class SnippetManager():
         if not quiet:
             log(f"discarding all snippets in package '{pkg_name}'")
 
-        self._discard_snippet_list(self._pkg_list.get(pkg_name, []))
+        # The whole package entry is dropped in one go, so only the other
+        # lists need to be visited for each snippet.
+        snippets = self._pkg_list.pop(pkg_name, {})
+        self._discard_snippet_list(list(snippets.values()))
 
 
     def reload_snippet(self, res_name):
@@ -303,6 +538,8 @@ class SnippetManager():
         if snippet:
             self.rewrite_commands_file({snippet.package})
 
+        self.cache.save(minor=True)
+
 
     def snippet_for_resource(self, res_name):
         """
@@ -312,25 +549,256 @@ class SnippetManager():
         return self._res_list.get(res_name, None)
 
 
+    def __manifest(self, prefix=''):
+        """
+        Return back a manifest of all of the snippets we currently know about
+        whose resource names start with the prefix given; this is a dictionary
+        whose keys are the resource names and whose values are tuples that
+        contain the digest of the resource and the package it's in.
+        """
+        return {res: (digest, self._res_list[res].package)
+                for res, digest in self._digests.items() if res.startswith(prefix)}
+
+
+    def on_ready(self, callback):
+        """
+        Register a callback to be invoked (with no arguments) once all of the
+        snippets are loaded. If they're already loaded, the callback is called
+        immediately.
+        """
+        if self.state == 'ready':
+            return callback()
+
+        self._ready_callbacks.append(callback)
+
+
+    def __set_state(self, state):
+        """
+        Update the readiness state; when everything is ready, any callbacks
+        that are waiting for that are called.
+        """
+        self.state = state
+        if state != 'ready':
+            return
+
+        callbacks, self._ready_callbacks = self._ready_callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as error:
+                log(f'error in snippet ready callback: {str(error)}')
+
+
+    def __scan_is_current(self, scan_id, prefix):
+        """
+        Given the identifier of a scan and the prefix that it was constrained
+        to, return an indication of whether the results of that scan are still
+        needed; a scan is replaced by any later scan of the same area, or by
+        any later full scan.
+        """
+        return (self._scan_ids.get(prefix) == scan_id and
+                self._scan_ids.get('', 0) <= scan_id)
+
+
+    def __scan_order(self, res):
+        """
+        Given a list of snippet resources, return them in the order that they
+        should be loaded; snippets that the cache says are for the scope of the
+        active view come first, so that they're available as soon as possible.
+        """
+        window = sublime.active_window()
+        view = window.active_view() if window is not None else None
+        if view is None:
+            return res
+
+        sel = view.sel()
+        scope = view.scope_name(sel[0].begin() if len(sel) else 0)
+
+        first, rest = [], []
+        for res_name in res:
+            selector = self.cache.scope(res_name)
+            if selector is not None and _selector_matches(scope, selector):
+                first.append(res_name)
+            else:
+                rest.append(res_name)
+
+        return first + rest
+
+
     def __scan_snippets(self, prefix=''):
         """
         Find and scan all snippets that are known to the package system and
-        whose resource names start with the prefix given. Each found snippet is
-        loaded and, if it is enhanced, returned back for us to add to the
-        manager.
+        whose resource names start with the prefix given.
+
+        This is incremental; the result of the scan is compared to what we
+        already know, so that only snippets that are new or changed are loaded
+        and only snippets that have gone away are discarded. Commands files are
+        only regenerated for packages whose snippets actually changed.
         """
+        from ..src.core import es_setting
+
+        # Any scan that is still in progress in the background is now out of
+        # date, since this one will replace its results.
+        self._scan_id += 1
+        self._scan_ids[prefix] = self._scan_id
+        self._scan_started[prefix] = time.perf_counter()
+        if not prefix:
+            self.__set_state('loading')
+
+        # Capture what things look like now, so that at the end we know what
+        # packages changed. Until a full scan has completed, what we know is
+        # only partial, so full scans compare against what things looked like
+        # in the last session instead (if we know that).
+        baseline = self.__manifest(prefix)
+        if not prefix and not self._session_scanned:
+            baseline = self._last_session
+
+        res = [r for r in sublime.find_resources('*.enhanced-sublime-snippet')
+                 if r.startswith(prefix)]
+
+        # If there is more than one worker configured, resources are fetched
+        # and parsed in a pool of background threads, and the results are
+        # added in a single batch when they're all done.
+        workers = es_setting('scan_workers')
+        if workers > 1 and len(res) > 1:
+            scan_id = self._scan_id
+            sublime.set_timeout_async(lambda: self.__parallel_scan(scan_id, res, prefix, baseline, workers))
+            return
+
+        # Full scans happen a little at a time in the main thread, so as not to
+        # block it; the snippets for the current view are loaded first, and
+        # snippets are available to be used as soon as they're loaded.
+        budget = es_setting('scan_time_budget')
+        if budget > 0 and not prefix:
+            res = self.__scan_order(res)
+            scan_id = self._scan_id
+            sublime.set_timeout(lambda: self.__scan_chunk(scan_id, res, prefix, baseline, [], budget / 1000))
+            return
+
         # Scan over all snippets, load them, and for any that return a Snippet
         # instance, add them to the appropriate lists.
-        found = set()
-        res = sublime.find_resources('*.enhanced-sublime-snippet')
-        for entry in [r for r in res if r.startswith(prefix)]:
-            snippet = self._load_snippet(entry)
-            if snippet:
-                found.add(snippet.package)
+        self.__finish_scan(res, prefix, baseline, [self._parse_snippet(entry) for entry in res])
+
+
+    def __scan_chunk(self, scan_id, res, prefix, baseline, results, budget):
+        """
+        Load as many of the given resources as possible in the given amount of
+        time (in seconds), starting after the ones that already have results,
+        adding each one to our lists as it's loaded. If there are any left,
+        this schedules itself to continue; otherwise the scan is finished.
+        """
+        if not self.__scan_is_current(scan_id, prefix):
+            return
+
+        end = time.perf_counter() + budget
+        while len(results) < len(res):
+            res_name = res[len(results)]
+            digest, snippet = self._parse_snippet(res_name)
+            results.append((digest, snippet))
+            self.__merge_snippet(res_name, digest, snippet)
+
+            if time.perf_counter() >= end:
+                break
+
+        if len(results) < len(res):
+            debug('loaded %d of %d snippets', len(results), len(res))
+            return sublime.set_timeout(lambda: self.__scan_chunk(scan_id, res, prefix, baseline, results, budget), 10)
+
+        self.__finish_scan(res, prefix, baseline, results)
+
+
+    def __parallel_scan(self, scan_id, res, prefix, baseline, workers):
+        """
+        Fetch and parse all of the given resources using a pool of worker
+        threads, then schedule the results to be added to our lists in the
+        main thread. This is invoked in the background by __scan_snippets().
+        """
+        debug('scanning %d snippets with %d workers', len(res), workers)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(self._parse_snippet, res))
+
+        def merge():
+            # If another scan started while we were working, our results are
+            # stale and the other scan will take care of things.
+            if self.__scan_is_current(scan_id, prefix):
+                self.__finish_scan(res, prefix, baseline, results)
+
+        sublime.set_timeout(merge)
+
 
-        # After a full scan, regenerate the commands file to ensure that all
-        # snippets that were found as a part of the scan are updated.
-        self.rewrite_commands_file(found)
+    def __finish_scan(self, res, prefix, baseline, results):
+        """
+        Given the list of resources that a scan found, the prefix that the scan
+        was constrained to, the manifest of the scanned area from before the
+        scan and the list of (digest, snippet) results from parsing those
+        resources (the snippet is None for any that failed to load), bring our
+        internal lists up to date and take care of any other work that is
+        needed at the end of a scan.
+        """
+        found = set(res)
+
+        # Anything in the scanned area that no longer exists is discarded.
+        self._discard_snippet_list([snippet for name, snippet in self._res_list.items()
+                                    if name.startswith(prefix) and name not in found],
+                                   rewrite=False)
+
+        # Add in any snippets that are new or have changed; unchanged snippets
+        # come back as the same object that we already have.
+        for res_name, (digest, snippet) in zip(res, results):
+            self.__merge_snippet(res_name, digest, snippet)
+
+        # Drop from the cache any snippets in the scanned area that no longer
+        # exist, and then persist any changes; changes from a scan of a single
+        # package are minor.
+        self.cache.prune(found, prefix)
+        self.cache.save(minor=bool(prefix))
+
+        # The packages that changed are the ones with a snippet that was added,
+        # removed or modified. If we don't know what things looked like before,
+        # then everything changed and any old commands files are suspect; they
+        # are all checked, and the ones that are still correct are left as is.
+        manifest = self.__manifest(prefix)
+        if baseline is None:
+            changed = {pkg for digest, pkg in manifest.values()}
+            changed.update(self._cmd_file_packages())
+        else:
+            changed = {pkg for res_name, (digest, pkg) in
+                       set(baseline.items()) ^ set(manifest.items())}
+
+        debug('scan complete; %d snippets, changed packages: %s', len(manifest), changed or 'none')
+        self.rewrite_commands_file(changed)
+
+        # Record how long the scan took, from start to finish.
+        elapsed = time.perf_counter() - self._scan_started.pop(prefix)
+        if prefix:
+            perf.record('scan.package', elapsed, prefix.split('/')[1])
+        else:
+            perf.record('scan', elapsed)
+
+        if not prefix:
+            self._session_scanned = True
+            self._last_session = None
+            self.__set_state('ready')
+
+
+    def __merge_snippet(self, res_name, digest, snippet):
+        """
+        Given a resource name that was scanned and the digest and snippet that
+        resulted from parsing it (the snippet is None if it failed to load),
+        update our lists to contain that snippet instead of any version of it
+        that we might already have.
+        """
+        # Snippets that are unchanged come back as the same object that we
+        # already have.
+        current = self._res_list.get(res_name)
+        if current is not None and current is snippet:
+            return
+
+        if current is not None:
+            self._discard_snippet_list([current], rewrite=False)
+
+        if snippet:
+            self._add_snippet(snippet, digest)
 
 
     def reload_enhancements(self):
@@ -343,23 +811,23 @@ class SnippetManager():
 
     def scan(self):
         """
-        Discard all of our lists of snippets and do a complete and total rescan
-        of the entire package ecosystem.
+        Rescan the entire package ecosystem for snippets, comparing the result
+        against what we already know; only snippets that are new or changed
+        are loaded, only snippets that have gone away are discarded, and only
+        the commands files of packages that changed are regenerated.
         """
         log('scanning for enhanced snippets across all packages')
-        self.discard_all(quiet=True)
-        self.discard_old_cmd_files()
         self.__scan_snippets()
 
 
     def scan_pkg(self, pkg_name):
         """
-        Given the name of a package, discard all of the snippets that are known
-        to be in that package (from all of the internal lists), and then do a
-        fresh scan of snippets that exist in that path and re-add them.
+        Given the name of a package, rescan the snippets in that package and
+        compare the result against the snippets that are known to be in it;
+        only snippets that are new or changed are loaded, and only snippets
+        that have gone away are discarded.
         """
         log(f"scanning for enhanced snippets in package '{pkg_name}'")
-        self.discard_pkg(pkg_name, quiet=True)
         self.__scan_snippets(f"Packages/{pkg_name}/")
 
 
@@ -371,7 +839,7 @@ class SnippetManager():
         result = []
         for scope, snippets in self._scope_list.items():
             if sublime.score_selector(scope, selector):
-                result.append(snippets)
+                result.append(list(snippets.values()))
 
         return result;
 
@@ -388,10 +856,47 @@ class SnippetManager():
         if snippet.glob == '':
             return True
 
+        # Globs from loaded snippets are tested in advance; only a glob from
+        # somewhere else (such as arguments to a command) has to be checked.
+        if snippet.glob in self._glob_list:
+            return snippet.glob in self.view_globs(view)
+
         if view.file_name() is None:
             return False
 
-        return fnmatch(view.file_name(), snippet.glob)
+        return bool(_compile_glob(snippet.glob)(normcase(view.file_name())))
+
+
+    def view_globs(self, view):
+        """
+        Given a view, return back the set of globs (from all of the loaded
+        snippets) that match the filename of that view. Views with no filename
+        don't match any globs.
+
+        The result is cached and only recalculated when the name of the file
+        in the view changes, or when the set of known globs changes.
+        """
+        filename = view.file_name()
+        cached = self._view_globs.get(view.id())
+        if cached is not None and cached[0] == filename:
+            return cached[1]
+
+        globs = frozenset()
+        if filename is not None:
+            name = normcase(filename)
+            globs = frozenset(glob for glob, match in self._glob_regex.items()
+                              if glob and match(name))
+
+        self._view_globs[view.id()] = (filename, globs)
+        return globs
+
+
+    def discard_view(self, view):
+        """
+        Given a view, discard any cached information that we might be holding
+        on to for it; this should be called when a view closes.
+        """
+        self._view_globs.pop(view.id(), None)
 
 
     def scope_match(self, view, locations, snippet):
@@ -405,7 +910,8 @@ class SnippetManager():
         if snippet.scope == '':
             return True
 
-        return all([view.match_selector(pt, snippet.scope) for pt in locations])
+        return all(_selector_matches(view.scope_name(pt), snippet.scope)
+                   for pt in locations)
 
 
     def snippet_applies(self, snippet, view, locations):
@@ -427,7 +933,29 @@ class SnippetManager():
         return self.enhancements.get_variable_classes(field_names)
 
 
-    def match_view(self, view, locations):
+    def candidates(self, prefix=None):
+        """
+        Given the prefix text that is being completed, return back an iterable
+        of all of the snippets whose tab trigger could potentially match it;
+        this does not take scope or glob into account.
+
+        When no prefix is given (or it is empty), all snippets are returned.
+        """
+        if not prefix:
+            return self._res_list.values()
+
+        # Snippets whose triggers start with the same character as the prefix
+        # could match, as can any in the catch all list.
+        key = _trigger_key(prefix)
+        result = self._trigger_list.get(key, {}).values()
+        if key != '':
+            result = chain(result, self._trigger_list.get('', {}).values())
+
+        return result
+
+
+    @perf.timed('match_view')
+    def match_view(self, view, locations, prefix=None):
         """
         Given a view and a list of locations, return back all snippets that
         match the scope in the current view at the given locations; this list
@@ -435,27 +963,135 @@ class SnippetManager():
 
         In order to be returned back, the scope of a snippet must match at all
         of the positions in the locations list.
+
+        If a prefix is provided, only snippets whose tab triggers could match
+        that prefix in the autocomplete panel are considered.
         """
         result = []
 
-        # Grab the filename for this view (if any) and then iterate over all
-        # snippets to find the ones that match in the current situation, whicn
-        # is a combination of glob and scope.
-        filename = view.file_name() or ''
-        for snippet in self._res_list.values():
-            if self.snippet_applies(snippet, view, locations):
+        # Many snippets share the same scope selector, and many locations
+        # share the same scope; gather the distinct scopes at the locations,
+        # and track the result of each distinct selector as we go so that it
+        # is only ever tested once.
+        scopes = {view.scope_name(pt) for pt in locations}
+        selectors = {'': True}
+
+        # Get the set of globs that match this view; snippets with no glob
+        # always match.
+        globs = self.view_globs(view)
+
+        # Iterate over all snippets that might match the prefix to find the
+        # ones that match in the current situation, which is a combination of
+        # glob and scope.
+        for snippet in self.candidates(prefix):
+            if snippet.glob and snippet.glob not in globs:
+                continue
+
+            matched = selectors.get(snippet.scope)
+            if matched is None:
+                matched = all(_selector_matches(scope, snippet.scope) for scope in scopes)
+                selectors[snippet.scope] = matched
+
+            if matched:
                 result.append(snippet)
 
         return result
 
 
+    def completion_item(self, snippet):
+        """
+        Given a snippet, return back the completion item that represents it in
+        the autocomplete panel. Snippets that we know about use the item that
+        was created when they were added; any other snippet gets a new one.
+        """
+        item = self._completions.get(snippet.resource)
+        if item is None or self._res_list[snippet.resource] is not snippet:
+            item = snippet_completion(snippet, self._use_details)
+
+        return item
+
+
+    def expansion_plan(self, snippet):
+        """
+        Given a snippet, return back the plan for expanding it. Snippets that
+        we know about use the plan that was created when they were added; any
+        other snippet gets a new one.
+        """
+        plan = self._plans.get(snippet.resource)
+        if plan is None or self._res_list[snippet.resource] is not snippet:
+            plan = self.__compile_plan(snippet)
+
+        return plan
+
+
+    def prefetch(self, snippets):
+        """
+        Given a list of snippets that are being offered in the autocomplete
+        panel, ask the enhancements that implement prefetching to produce the
+        values for the variables those snippets use in the background, so
+        that they're ready if one of the snippets is picked.
+        """
+        names = self.enhancements.prefetch_names()
+        if not names:
+            return
+
+        requests = []
+        for snippet in snippets:
+            if names.isdisjoint(snippet.variables):
+                continue
+
+            for enhancement, slots in self.expansion_plan(snippet).steps:
+                if enhancement.variable_name() in names:
+                    requests.append((snippet.resource, enhancement, slots))
+
+        self.enhancements.prefetch(requests)
+
+
+    def option_items(self, snippet, field):
+        """
+        Given a snippet and one of its field numbers, return back a tuple of
+        the placeholder for that field and the list of quick panel items for
+        its options, or None if the field has no options. Snippets that we
+        know about use the items that were created when they were added; any
+        other snippet gets new ones.
+        """
+        items = self._option_items.get(snippet.resource)
+        if items is None or self._res_list[snippet.resource] is not snippet:
+            items = snippet_option_items(snippet)
+
+        return items.get(field)
+
+
+    def __compile_plan(self, snippet):
+        """
+        Create and return the expansion plan for the given snippet, based on
+        the enhancements that are currently known.
+        """
+        return compile_expansion_plan(snippet, self.enhancements)
+
+
+    def update_completions(self, use_details):
+        """
+        Called when the setting that controls whether completion items include
+        details has changed; if the value is different than the one that the
+        current completion items were created with, they're all recreated.
+        """
+        if use_details == self._use_details:
+            return
+
+        debug('recreating completion items; use_details is now %s', use_details)
+        self._use_details = use_details
+        self._completions = {res: snippet_completion(snippet, use_details)
+                             for res, snippet in self._res_list.items()}
+
+
     def matching_pkg(self, pkg_name):
         """
         Given a package name, return back a lsit of all of the snippets that
         are being contributed by that particular package. This list may be
         empty.
         """
-        return self._pkg_list.get(pkg_name, [])
+        return list(self._pkg_list.get(pkg_name, {}).values())
 
 
     def matching(self, res_name):
@@ -474,21 +1110,83 @@ class SnippetManager():
         this snippet; otherwise this will return None, including on errors
         (which will be logged to the console).
         """
-        try:
-            # Try to load in the snippet resource; this can be in one of two
-            # different formats
-            snippet = load_snippet(res_name, is_resource=True)
+        digest, snippet = self._parse_snippet(res_name)
+        if snippet:
+            self._add_snippet(snippet, digest)
+
+        return snippet
 
-            # Link the snippet into our tables, then return
-            debug(f'adding snippet: {snippet.resource}')
-            self._res_list[snippet.resource] = snippet
-            _get_list(self._scope_list, snippet.scope).append(snippet)
-            _get_list(self._pkg_list, snippet.package).append(snippet)
 
-            return snippet
+    def _parse_snippet(self, res_name):
+        """
+        Given a package resource, attempt to load it as a snippet and return
+        back a tuple of the digest of the resource content and the Snippet
+        instance, without adding it to any of our internal lists. If the
+        resource has not changed since its snippet was added to our lists, the
+        snippet that is already in the list is returned.
+
+        On errors (which will be logged to the console), the snippet in the
+        return value is None.
 
-        except Exception as err:
-            log(f"Error loading snippet: {err}")
+        This does not modify any of the snippet lists, and so it is safe to
+        call from a background thread.
+        """
+        with perf.timed('parse', res_name.split('/')[1]):
+            try:
+                # Load the content of the resource and check to see if it's the
+                # same as the one we already know about.
+                data = sublime.load_resource(res_name)
+                digest = resource_digest(data)
+
+                snippet = self._res_list.get(res_name)
+                if snippet is not None and self._digests.get(res_name) == digest:
+                    perf.increment('parse.unchanged')
+                    return digest, snippet
+
+                # If it has not changed since the last time it was parsed, the
+                # cache has the snippet already. Otherwise, parse it and cache
+                # the result for next time.
+                snippet = self.cache.lookup(res_name, digest)
+                if snippet is None:
+                    perf.increment('parse.cache_miss')
+                    snippet = snippet_from_resource(res_name, data)
+                    self.cache.store(res_name, digest, snippet)
+                else:
+                    perf.increment('parse.cache_hit')
+
+                return digest, snippet
+
+            except Exception as err:
+                log(f"Error loading snippet: {err}")
+                self.cache.discard(res_name)
+                return None, None
+
+
+    def _add_snippet(self, snippet, digest):
+        """
+        Given a snippet instance and the digest of the resource it was loaded
+        from, link it into all of our internal lists.
+        """
+        debug('adding snippet: %s', snippet.resource)
+        self._res_list[snippet.resource] = snippet
+        self._digests[snippet.resource] = digest
+        self._completions[snippet.resource] = snippet_completion(snippet, self._use_details)
+        self._plans[snippet.resource] = self.__compile_plan(snippet)
+        if snippet.options:
+            self._option_items[snippet.resource] = snippet_option_items(snippet)
+        res = snippet.resource
+        _get_entries(self._scope_list, snippet.scope)[res] = snippet
+        _get_entries(self._pkg_list, snippet.package)[res] = snippet
+        _get_entries(self._trigger_list, _trigger_key(snippet.trigger))[res] = snippet
+        for variable in snippet.variables:
+            _get_entries(self._var_list, variable)[res] = snippet
+
+        # Compile the glob the first time it's seen, and since this changes
+        # the set of known globs, drop the cached glob list for all views.
+        if snippet.glob not in self._glob_list:
+            self._glob_regex[snippet.glob] = _compile_glob(snippet.glob)
+            self._view_globs = {}
+        _get_entries(self._glob_list, snippet.glob)[res] = snippet
 
 
 ## ----------------------------------------------------------------------------
@@ -1,12 +1,16 @@
 import sublime
 
-from collections import namedtuple
+from collections import deque, namedtuple
 from os.path import basename
 import re
+import time
 
 from EnhancedSnippets import frontmatter
 import xml.etree.ElementTree as ElementTree
 
+from .header_loader import load_snippet_header
+from . import perf
+
 from Default.new_templates import reformat
 
 
@@ -23,6 +27,22 @@ Snippet = namedtuple('Snippet', [
     'scope', 'glob', 'resource', 'package'
 ])
 
+# This named tuple is used to represent the plan for expanding out a snippet;
+# it's created when the snippet is loaded so that the work that depends only on
+# the content of the snippet doesn't need to happen at expansion time. This
+# includes the snippet content (as rewritten by the enhancements that it uses),
+# a list of (enhancement, slots) tuples for the enhancements that need to
+# provide values for their slots, and the list of enhancements that could not
+# be compiled, whose variables() method needs to be called on every expansion.
+ExpansionPlan = namedtuple('ExpansionPlan', [
+    'content', 'steps', 'dynamic'
+])
+
+# Our injected completions use this kind information to mark themselves in the
+# autocomplete panel; since we're effectively going to duplicate any snippets
+# that contain dates, this will help disambiguate them for people.
+RES_KIND_ENHANCED_SNIPPET = (sublime.KIND_ID_COLOR_BLUISH, "s", "Snippet [Enhanced]")
+
 # The regex that matches a variable in a snippet; this doesn't validate that
 # the variable is fully valid, only that it appears to be a variable name.
 _var_regex = re.compile(r"(?:^|[^\\])\$\{?(\w+)")
@@ -44,7 +64,24 @@ class SnippetHandler(frontmatter.YAMLHandler):
     class uses a template for the generated Post output that includes a blank
     line between the frontmatter and the post content, which is not what we
     want or need for our usage in snippets.
+
+    In addition, the load method first tries a fast loader that understands
+    only the subset of YAML that snippet headers need, falling back to the
+    full YAML loader for anything else.
     """
+    def load(self, fm, **kwargs):
+        """
+        Parse YAML front matter, using the fast snippet header loader when
+        possible.
+        """
+        if not kwargs:
+            data = load_snippet_header(fm)
+            if data is not None:
+                return data
+
+        return super().load(fm, **kwargs)
+
+
     def format(self, post, **kwargs):
         """
         Turn a post into a string, used in ``frontmatter.dumps``
@@ -71,12 +108,39 @@ class SnippetHandler(frontmatter.YAMLHandler):
 ## ----------------------------------------------------------------------------
 
 
-def log(message, *args, status=False, dialog=False):
+# The most recent log records, including debug records that were not displayed
+# because debugging is turned off; these can be displayed on demand. Each
+# record is a tuple of the time, the level, the message and the arguments, and
+# the message is only formatted with the arguments when it's displayed.
+_log_records = deque(maxlen=1000)
+
+# Whether debug logging is currently turned on; this mirrors the debug setting
+# and is kept up to date by set_debug_logging().
+_debug_enabled = False
+
+
+def set_debug_logging(enabled):
     """
-    Simple logging method; writes to the console and optionally also the status
-    message as well.
+    Turn the output of debug logs on or off.
     """
-    message = message % args
+    global _debug_enabled
+    _debug_enabled = bool(enabled)
+
+
+def _format_record(message, args):
+    """
+    Format the message of a log record with its arguments, if any.
+    """
+    return message % args if args else message
+
+
+def _emit(level, message, args, status, dialog):
+    """
+    Record a log record at the given level, then format it and display it.
+    """
+    _log_records.append((time.time(), level, message, args))
+
+    message = _format_record(message, args)
     print("EnhancedSnippets:", message)
     if status:
         sublime.status_message(message)
@@ -84,6 +148,16 @@ def log(message, *args, status=False, dialog=False):
         sublime.message_dialog(message)
 
 
+def log(message, *args, status=False, dialog=False):
+    """
+    Simple logging method; writes to the console and optionally also the status
+    message as well.
+
+    The message is formatted with the arguments (if any) using the % operator.
+    """
+    _emit('log', message, args, status, dialog)
+
+
 ## ----------------------------------------------------------------------------
 
 
@@ -114,10 +188,34 @@ def debug(message, *args, status=False, dialog=False):
     """
     Generate a debug log; this is functionally identical to the log method
     except that it will only generate output if debugging is turned on.
+
+    When debugging is off, the message is only recorded and not formatted, so
+    callers should pass any values as arguments rather than formatting them
+    into the message themselves.
     """
-    from ..src.core import es_setting
-    if es_setting('debug'):
-        log(message, *args, status=status, dialog=dialog)
+    if not _debug_enabled:
+        _log_records.append((time.time(), 'debug', message, args))
+        return
+
+    _emit('debug', message, args, status, dialog)
+
+
+def recent_log_records():
+    """
+    Return back a list of the most recent log records as text, oldest first;
+    this includes debug records even if debugging is turned off.
+    """
+    result = []
+    for stamp, level, message, args in list(_log_records):
+        try:
+            message = _format_record(message, args)
+        except Exception as error:
+            message = f'{message} {args} (unable to format: {error})'
+
+        when = time.strftime('%H:%M:%S', time.localtime(stamp))
+        result.append(f'{when}.{int(stamp * 1000) % 1000:03} {level:5} {message}')
+
+    return result
 
 
 ## ----------------------------------------------------------------------------
@@ -391,45 +489,125 @@ def load_snippet(res_or_content, scope='', glob='', is_resource=True):
     not a valid snippet file.
     """
     if is_resource:
-        pkg_name = res_or_content.split('/')[1]
-        resource = res_or_content
-
         # Load the contents of the snippet as a string, then parse it as a
         # YAML snippet.
         data = sublime.load_resource(res_or_content)
-        raw = _do_yaml_load(data)
-        if raw is None:
-            raise ValueError(f'{res_or_content} is invalid or not in a recognized format')
+        return snippet_from_resource(res_or_content, data)
+
+    # If we get content, we don't need to load a file, we just have the
+    # content directly, but with no other information associated with it.
+    raw = {
+        'tabTrigger': '',
+        'description': '',
+        'content': res_or_content,
+        'scope': scope,
+        'glob': glob,
+        # NOTE: This triggers for provided content; we should probably
+        #       allow options to be provided this way or something so
+        #       someone can trigger the command with options?
+        'options': {}
+    }
 
-    else:
-        pkg_name = ''
-        resource = ''
-
-        # If we get content, we don't need to load a file, we just have the
-        # content directly, but with no other information associated with it.
-        raw = {
-            'tabTrigger': '',
-            'description': '',
-            'content': res_or_content,
-            'scope': scope,
-            'glob': glob,
-            # NOTE: This triggers for provided content; we should probably
-            #       allow options to be provided this way or something so
-            #       someone can trigger the command with options?
-            'options': {}
-        }
+    return _make_snippet(raw, '', '')
+
+
+def snippet_from_resource(res_name, data):
+    """
+    Given the name of a snippet resource and the content of that resource as
+    a string, parse it out to obtain a Snippet instance which will be returned
+    back.
 
+    This will raise an exception if the content is not a valid snippet.
+    """
+    raw = _do_yaml_load(data)
+    if raw is None:
+        raise ValueError(f'{res_name} is invalid or not in a recognized format')
+
+    return _make_snippet(raw, res_name, res_name.split('/')[1])
+
+
+def _make_snippet(raw, resource, pkg_name):
+    """
+    Given the raw dictionary version of a loaded snippet, the resource that it
+    came from and the package that it is contained in, return back a Snippet
+    instance that represents it.
+    """
     # Get the list of variables and numeric fields from this snippet
     variables = _get_variables(raw['content'])
     fields = _get_fields(raw['content'])
 
-    # Get the package name that this resource is in and create a new
-    # instance.
     return Snippet(raw['tabTrigger'], raw['description'],
         raw['content'].lstrip(), variables, fields, raw['options'],
         raw['scope'], raw['glob'], resource, pkg_name)
 
 
+def snippet_completion(snippet, use_details):
+    """
+    Given a snippet, create and return the completion item that represents it
+    in the autocomplete panel; the flag indicates whether the details area of
+    the completion should indicate that this is an enhanced snippet.
+    """
+    completion = {
+        'trigger': snippet.trigger,
+        'command': 'insert_enhanced_snippet',
+        'args': { 'name': snippet.resource },
+        'annotation': f"{snippet.description}",
+        'kind': RES_KIND_ENHANCED_SNIPPET,
+    }
+
+    if use_details:
+        completion['details'] = 'Enhanced Snippet'
+
+    return sublime.CompletionItem.command_completion(**completion)
+
+
+def snippet_option_items(snippet):
+    """
+    Given a snippet, create and return the quick panel items for the options of
+    each of its fields; the result is a dictionary whose keys are the field
+    numbers and whose values are tuples of the placeholder for the field and
+    the list of items to display.
+    """
+    return {
+        field: (options[0], [sublime.QuickPanelItem(t.get('text', 'snippet values are borked'),
+                                                    details=t.get('details') or '')
+                             for t in options[1:]])
+        for field, options in snippet.options.items()
+    }
+
+
+def compile_expansion_plan(snippet, enhancements):
+    """
+    Given a loaded snippet and the enhancement manager that knows about the
+    enhancement classes that are used to expand out the custom variables in
+    it, return back the expansion plan for the snippet.
+    """
+    # Most enhancements can be compiled by the enhancement manager in a single
+    # pass over the content; this gives us the ones that can't.
+    content, steps, enhancers = enhancements.compile_content(snippet.content,
+                                                             snippet.variables)
+    dynamic = []
+
+    # As we loop through, we adjust the content that is passed to subsequent
+    # handlers, since we may need to rewrite the snippet content in order to
+    # implement some variables.
+    for enhancement in enhancers:
+        compiled = enhancement.compile(content)
+        if compiled is None:
+            dynamic.append(enhancement)
+        else:
+            slots, content = compiled
+            steps.append((enhancement, slots))
+
+    # When there is nothing left to rewrite the content at expansion time, it
+    # can be put into its final form now.
+    if not dynamic:
+        content = content.lstrip()
+
+    return ExpansionPlan(content, steps, dynamic)
+
+
+@perf.timed('expansion')
 def snippet_expansion_args(snippet, manager, extra_args):
     """
     Given a loaded snippet and a dictionary with any extra variable arguments
@@ -438,25 +616,63 @@ def snippet_expansion_args(snippet, manager, extra_args):
     arguments to insert_snippet, which insert that snippet in with all of the
     custom variables (that are known) properly expanded out
     """
-    # Get the list of classes that are used to expand out the custom
-    # variables in this snippet.
-    enhancers = manager.get_variable_classes(snippet.variables)
+    # Get the plan for expanding this snippet.
+    plan = manager.expansion_plan(snippet)
+
+    # Asynchronous enhancements produce their values in the background, but
+    # must be finished by this deadline or the snippet expands without them.
+    enhancements = manager.enhancements
+    deadline = None
+    def start(func, *args):
+        nonlocal deadline
+        if deadline is None:
+            from ..src.core import es_setting
+            deadline = time.perf_counter() + es_setting('enhancement_deadline') / 1000
+
+        return enhancements.submit(func, *args)
 
     # Construct the arguments that are going to be passed to the snippet
-    # command when the completion invokes.
-    #
-    # As we loop through, we adjust the content that is passed to
-    # subsequent handlers, since we may need to rewrite the snippet content
-    # in order to implement some variables.
+    # command when the completion invokes; the compiled enhancements only
+    # need to provide the values for their variables.
     snippet_args = dict(extra_args)
-    content = snippet.content
-    for enhancement in enhancers:
-        new_vars, content = enhancement.variables(content)
+    pending = []
+    for enhancement, slots in plan.steps:
+        # Values that were prefetched when the snippet was offered as a
+        # completion are used if they're still fresh.
+        new_vars = enhancements.take_prefetched(snippet.resource, enhancement, slots)
+        if new_vars is not None:
+            snippet_args.update(new_vars)
+        elif enhancement.is_async():
+            pending.append((enhancement, start(enhancements.expand, enhancement, slots)))
+        else:
+            snippet_args.update(enhancements.expand(enhancement, slots))
+
+    # Enhancements that could not be compiled get to see (and possibly
+    # rewrite) the content every time.
+    content = plan.content
+    for enhancement in plan.dynamic:
+        if enhancement.is_async():
+            result = enhancements.wait(start(enhancements.variables, enhancement, content),
+                                       deadline, enhancement)
+            if result is None:
+                continue
+
+            new_vars, content = result
+        else:
+            new_vars, content = enhancements.variables(enhancement, content)
+
         snippet_args.update(new_vars)
 
+    # Collect the values of the asynchronous enhancements; any that are not
+    # ready by the deadline are left out, so their default text is used.
+    for enhancement, future in pending:
+        new_vars = enhancements.wait(future, deadline, enhancement)
+        if new_vars is not None:
+            snippet_args.update(new_vars)
+
     # Include the adjusted content into the arguments so that we can
     # expand it.
-    snippet_args['contents'] = content.lstrip()
+    snippet_args['contents'] = content.lstrip() if plan.dynamic else content
 
     return snippet_args
 
@@ -464,32 +680,61 @@ def snippet_expansion_args(snippet, manager, extra_args):
 ## ----------------------------------------------------------------------------
 
 
-def prepare_snippet_info(view, fields, options):
-    """
-    Given a view, a list of fields, and options for those fields, update the
-    tracking information in the current view to know that is the snippet that
-    is about to be expanded.
+# The expansion sessions for all views that are currently expanding an enhanced
+# snippet; the keys are view ids and the values are dictionaries that hold the
+# snippet being expanded and the index of the field that is currently active.
+# This lives only in memory, so it's never persisted into the session file.
+_sessions = {}
+
 
-    fields is a list of all of the numeric fields as strings (e.g. "1", "2"")
-    which must be in numeric order, except for "0", which must always be
-    present and always be at the end.
+def prepare_snippet_info(view, snippet):
+    """
+    Given a view and the snippet that is about to be expanded in it, start a
+    new expansion session for the view to know that is the snippet that is
+    being expanded.
 
-    options is a dictionary whose keys are field numbers and whose values are
-    arrays that list the options; the first item in the array is the
-    placeholder that explains what the field is for, and the remainder of the
-    items are the options to pick from.
+    The session holds a reference to the snippet (and thus the resource it came
+    from, its numeric fields and the options for them) along with the index of
+    the field that is currently active and the indexes of the fields that have
+    options; nothing is copied, so snippets with large lists of options cost no
+    more to track than those without. Snippets that have no options at all
+    don't need a session, since there is nothing to prompt for.
 
     If this view has any tracking information for a snippet (including any
-    regions from a previous call), they will be removed prior to the new data
-    being set in.
+    regions from a previous call), they will be removed prior to the new
+    session being started.
     """
     clear_snippet_info(view)
 
-    view.settings().set('_es_cache', {
-        'fields': fields,
-        'options': options,
+    option_fields = frozenset(idx for idx, field in enumerate(snippet.fields)
+                              if field in snippet.options)
+    if not option_fields:
+        return
+
+    _sessions[view.id()] = {
+        'snippet': snippet,
+        'resource': snippet.resource,
+        'option_fields': option_fields,
         'current_field_idx': 0
-    })
+    }
+
+
+def snippet_session(view):
+    """
+    Return back the expansion session for the given view, or None if there is
+    no enhanced snippet currently being expanded there.
+    """
+    return _sessions.get(view.id())
+
+
+def has_snippet_session(view):
+    """
+    Return back an indication of whether the given view has an expansion
+    session; this is what the event listener consults on every text command,
+    so that views that are not expanding an enhanced snippet pay only for a
+    dictionary lookup.
+    """
+    return view.id() in _sessions
 
 
 def clear_snippet_info(view):
@@ -497,22 +742,28 @@ def clear_snippet_info(view):
     Clear from the passed in view all tracking information about an enhanced
     snippet that is being expanded out.
 
-    This will remove the tracking regions along with the setting that tracks
+    This will remove the tracking regions along with the session that tracks
     the snippet details.
     """
-    if view.settings().has('_es_cache'):
-        fields = view.settings().get('_es_cache').get('fields', [])
-        for field in fields:
+    session = _sessions.pop(view.id(), None)
+    if session is not None:
+        for field in session['snippet'].fields:
             view.erase_regions(f'_es_field_{field}')
 
-    view.settings().erase('_es_cache')
+
+def discard_snippet_session(view):
+    """
+    Throw away the expansion session for the given view without touching the
+    view itself; this is used when the view is closing.
+    """
+    _sessions.pop(view.id(), None)
 
 
 def handle_snippet_field_move(view, direction):
     """
     If this view is currently in the process of expanding a special snippet,
     then this function will jump the internal list of fields to point at the
-    correct field, and update the object accordingly.
+    correct field, and update the session accordingly.
 
     direction can be:
         1: if we are going to the next field
@@ -521,10 +772,11 @@ def handle_snippet_field_move(view, direction):
 
     Once the move happens, the field is checked to see if it is one of the
     ones that has a special value, and if it is, we will prompt via a quick
-    panel for the text to insert.
+    panel for the text to insert. Moving to the final field of a snippet ends
+    the expansion, so unless that field has options the session is discarded.
     """
-    data = view.settings().get('_es_cache', None)
-    if data is None:
+    session = _sessions.get(view.id())
+    if session is None:
         return
 
     # TODO: This should bounds check the navigation to make sure that it is
@@ -533,8 +785,15 @@ def handle_snippet_field_move(view, direction):
     #       ways.
     #
     # Apply the direction to determine what the current field is.
-    data["current_field_idx"] = data["current_field_idx"] + direction
-    view.settings().set('_es_cache', data)
+    field_idx = session['current_field_idx'] + direction
+    session['current_field_idx'] = field_idx
+
+    # Nothing to do unless the field we landed on has options; if it doesn't
+    # and it's the last field, the snippet is done expanding.
+    if field_idx not in session['option_fields']:
+        if field_idx >= len(session['snippet'].fields) - 1:
+            clear_snippet_info(view)
+        return
 
     # Our picker command requires the selection to be updated, and it might not
     # be if we were executed from a command, so schedule a call for the next
@@ -18,6 +18,7 @@ __all__ = [
     # Commands
     "EnhancedSnippetRefreshCacheCommand",
     "EnhancedSnippetRefreshEnhancementsCommand",
+    "EnhancedSnippetRestoreEnhancementsCommand",
     "InsertEnhancedSnippetCommand",
 
     # The commands called by InsertEnhancedSnippetCommand (or by commands it
@@ -29,4 +30,6 @@ __all__ = [
     # Utility Commands
     "NewEnhancedSnippetCommand",
     "ConvertToEnhancedSnippetCommand",
+    "EnhancedSnippetShowPerformanceStatsCommand",
+    "EnhancedSnippetShowLogCommand",
 ]
\ No newline at end of file
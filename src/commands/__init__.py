@@ -3,21 +3,27 @@ from ...enhanced_snippets import reload
 reload("src.commands", ["refresh_cache", "refresh_enhancements",
                         "insert_snippet", "field_picker",
                         "insert_snippet_option", "insert_and_mark",
-                        "new_snippet", "convert_snippet"])
+                        "new_snippet", "convert_snippet",
+                        "performance_stats", "show_log",
+                        "restore_enhancements"])
 
 from .refresh_cache import EnhancedSnippetRefreshCacheCommand
 from .refresh_enhancements import EnhancedSnippetRefreshEnhancementsCommand
+from .restore_enhancements import EnhancedSnippetRestoreEnhancementsCommand
 from .insert_snippet import InsertEnhancedSnippetCommand
 from .field_picker import EnhancedSnippetFieldPickerCommand
 from .insert_snippet_option import InsertEnhancedSnippetOptionCommand
 from .insert_and_mark import EnhancedSnippetInsertAndMarkCommand
 from .new_snippet import NewEnhancedSnippetCommand
 from .convert_snippet import ConvertToEnhancedSnippetCommand
+from .performance_stats import EnhancedSnippetShowPerformanceStatsCommand
+from .show_log import EnhancedSnippetShowLogCommand
 
 __all__ = [
     # Utility commands
     "EnhancedSnippetRefreshCacheCommand",
     "EnhancedSnippetRefreshEnhancementsCommand",
+    "EnhancedSnippetRestoreEnhancementsCommand",
 
     # Enhancement command
     "InsertEnhancedSnippetCommand",
@@ -31,4 +37,6 @@ __all__ = [
     # Utility Commands
     "NewEnhancedSnippetCommand",
     "ConvertToEnhancedSnippetCommand",
+    "EnhancedSnippetShowPerformanceStatsCommand",
+    "EnhancedSnippetShowLogCommand",
 ]
\ No newline at end of file
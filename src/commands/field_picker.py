@@ -1,6 +1,8 @@
 import sublime
 import sublime_plugin
 
+from ...lib import snippet_session
+
 
 ## ----------------------------------------------------------------------------
 
@@ -13,25 +15,22 @@ class EnhancedSnippetFieldPickerCommand(sublime_plugin.TextCommand):
     """
     def run(self, edit):
         # Get the current field out of the field list
-        data = self.view.settings().get('_es_cache', {})
-        cur_field = data["fields"][data["current_field_idx"]]
-
-        # Get the options for this field, if any; when there are, the result is
-        # an array where the first item is the placeholder and the remainder of
-        # the items are the actual values; prompt with a quick panel.
-        options = list(data["options"].get(cur_field, []))
-        if options:
+        session = snippet_session(self.view)
+        snippet = session["snippet"]
+        cur_field = snippet.fields[session["current_field_idx"]]
+
+        # If this field has options, prompt for them with a quick panel; the
+        # items for the panel were built when the snippet was loaded, so all
+        # that is passed along is the field whose options should be used.
+        if cur_field in snippet.options:
             self.view.run_command('insert_enhanced_snippet_option', {
-                "field": cur_field,
-                "placeholder": options[0],
-                "options": options[1:]
+                "field": cur_field
             })
 
     def is_enabled(self):
         # We are only able to run if there is tracking information for the view
         # that might have some options.
-        # Getting
-        return self.view.settings().get('_es_cache', None) is not None
+        return snippet_session(self.view) is not None
 
 
 ## ----------------------------------------------------------------------------
@@ -30,9 +30,9 @@ class InsertEnhancedSnippetCommand(sublime_plugin.TextCommand):
         if snippet is None:
             return log(f"insert_enhanced_snippet was unable to find/load '{name}'")
 
-        # Pull out the list of numeric fields and the options for them that we
-        # should apply and store them into the view.
-        prepare_snippet_info(self.view, snippet.fields, snippet.options)
+        # Start an expansion session in the view for this snippet, so that the
+        # options for its numeric fields can be offered as they're visited.
+        prepare_snippet_info(self.view, snippet)
 
         # Expand it out now.
         snippet_args = snippet_expansion_args(snippet, SnippetManager.instance, kwargs)
@@ -1,7 +1,7 @@
 import sublime
 import sublime_plugin
 
-from ...lib import handle_snippet_field_move
+from ...lib import SnippetManager, handle_snippet_field_move, snippet_session
 
 
 ## ----------------------------------------------------------------------------
@@ -19,8 +19,12 @@ class InsertEnhancedSnippetOptionCommand(sublime_plugin.TextCommand):
     Given a field number in the snippet that is currently expanding, a list of
     options to pick from and the placeholder for the items, display a quick
     panel to allow the user to pick from the available options.
+
+    When no options are given, the options for the field are taken from the
+    snippet that is currently expanding in the view, using the quick panel
+    items that were created when that snippet was loaded.
     """
-    def run(self, edit, field, placeholder, options):
+    def run(self, edit, field, placeholder=None, options=None):
         def insert(idx):
             # Regardless of choice, remove the region markers.
             self.view.erase_regions('_es_cursors')
@@ -42,6 +46,21 @@ class InsertEnhancedSnippetOptionCommand(sublime_plugin.TextCommand):
                     self.view.run_command('next_field')
                     handle_snippet_field_move(self.view, 1)
 
+        # Get the items to display; these are either created from the options
+        # that we were given, or are the ones that already exist for the field
+        # in the snippet that is expanding.
+        if options is None:
+            session = snippet_session(self.view)
+            items = session and SnippetManager.instance.option_items(session['snippet'], field)
+            if not items:
+                return
+
+            placeholder, options = items
+        else:
+            options = [sublime.QuickPanelItem(t.get('text', 'snippet values are borked'),
+                                              details=t.get('details', ''))
+                       for t in options]
+
         # If there are any regions associated with this field, then use them to
         # replace the selection so that if the user picks an option, the value
         # that is currently in place will be replaced.
@@ -56,10 +75,6 @@ class InsertEnhancedSnippetOptionCommand(sublime_plugin.TextCommand):
                               scope='comment',
                               flags=sublime.DRAW_NO_FILL|sublime.DRAW_EMPTY)
 
-        options = [sublime.QuickPanelItem(t.get('text', 'snippet values are borked'),
-                                          details=t.get('details', ''))
-                   for t in options]
-
         # Show the quick panel to allow the user to pick from the options that
         # we were given.
         self.view.window().show_quick_panel(options, placeholder=placeholder,
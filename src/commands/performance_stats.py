@@ -0,0 +1,76 @@
+import sublime
+import sublime_plugin
+
+from os import makedirs
+from os.path import join
+import platform
+import time
+
+from ...lib import log, perf
+
+
+## ----------------------------------------------------------------------------
+
+
+# The name of the output panel that the statistics are displayed in, and the
+# name of the file (in our cache folder) that they can be saved to.
+_panel_name = 'EnhancedSnippets Performance'
+_stats_file = 'performance_stats.json'
+
+
+## ----------------------------------------------------------------------------
+
+
+class EnhancedSnippetShowPerformanceStatsCommand(sublime_plugin.ApplicationCommand):
+    """
+    Display the performance statistics that have been collected since the
+    package was loaded (or since they were last reset) in an output panel.
+
+    If save is True, the statistics are also saved as JSON in the cache folder,
+    along with details of the version of Sublime and the platform, so that the
+    results can be compared across machines and releases. If reset is True,
+    the statistics are discarded after they're displayed.
+    """
+    def run(self, save=False, reset=False):
+        stats = perf.snapshot()
+
+        window = sublime.active_window()
+        panel = window.create_output_panel(_panel_name)
+        panel.run_command('append', {'characters': perf.format_stats(stats)})
+        window.run_command('show_panel', {'panel': f'output.{_panel_name}'})
+
+        if save:
+            self._save(stats)
+
+        if reset:
+            perf.reset()
+
+
+    def _save(self, stats):
+        """
+        Save the given statistics to the stats file in our cache folder.
+        """
+        folder = join(sublime.cache_path(), __name__.split('.')[0])
+        filename = join(folder, _stats_file)
+
+        data = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'sublime_version': sublime.version(),
+            'platform': sublime.platform(),
+            'arch': sublime.arch(),
+            'python': platform.python_version(),
+            **stats
+        }
+
+        try:
+            makedirs(folder, mode=0o777, exist_ok=True)
+            with open(filename, 'wt', encoding='utf-8') as file:
+                file.write(sublime.encode_value(data, True))
+
+            log(f'performance statistics saved to {filename}', status=True)
+
+        except Exception as error:
+            log(f'unable to save performance statistics: {str(error)}', status=True)
+
+
+## ----------------------------------------------------------------------------
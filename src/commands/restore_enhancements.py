@@ -0,0 +1,24 @@
+import sublime
+import sublime_plugin
+
+from ...lib import SnippetManager
+
+
+## ----------------------------------------------------------------------------
+
+
+class EnhancedSnippetRestoreEnhancementsCommand(sublime_plugin.ApplicationCommand):
+    """
+    When invoked, this restores all of the snippet enhancements that were
+    quarantined because they took too long to produce their values, so that
+    they are used again when snippets expand.
+    """
+    def run(self):
+        SnippetManager.instance.enhancements.restore_quarantined()
+
+
+    def is_enabled(self):
+        return bool(SnippetManager.instance.enhancements.quarantined)
+
+
+## ----------------------------------------------------------------------------
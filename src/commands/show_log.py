@@ -0,0 +1,32 @@
+import sublime
+import sublime_plugin
+
+from ...lib import recent_log_records
+
+
+## ----------------------------------------------------------------------------
+
+
+# The name of the output panel that the log records are displayed in.
+_panel_name = 'EnhancedSnippets Log'
+
+
+## ----------------------------------------------------------------------------
+
+
+class EnhancedSnippetShowLogCommand(sublime_plugin.ApplicationCommand):
+    """
+    Display the most recent log records in an output panel; this includes the
+    debug records, even if debugging is not currently turned on, which makes it
+    possible to see what led up to a problem after it happens.
+    """
+    def run(self):
+        records = recent_log_records()
+
+        window = sublime.active_window()
+        panel = window.create_output_panel(_panel_name)
+        panel.run_command('append', {'characters': '\n'.join(records) + '\n'})
+        window.run_command('show_panel', {'panel': f'output.{_panel_name}'})
+
+
+## ----------------------------------------------------------------------------
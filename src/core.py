@@ -1,6 +1,7 @@
 import sublime
 
 from ..lib import SnippetManager, EnhancementManager, SnippetSettingsListener
+from ..lib import set_debug_logging
 
 
 ## ----------------------------------------------------------------------------
@@ -22,9 +23,17 @@ def loaded():
     es_setting.obj = sublime.load_settings("EnhancedSnippets.sublime-settings")
     es_setting.default = {
         "use_details": True,
+        "scan_workers": 0,
+        "scan_time_budget": 20,
+        "enhancement_deadline": 250,
+        "enhancement_budget": 100,
         "debug": False,
     }
 
+    # Debug logging is checked often, so the state of the setting is cached;
+    # it gets updated when the settings change.
+    set_debug_logging(es_setting('debug'))
+
     # Create the settings listener, which will attach to the global preferences
     # and which allows interested things to know when settings are changing.
     global _settings_listener
@@ -39,12 +48,33 @@ def loaded():
     # how to enhance snippets.
     SnippetManager(_settings_listener, enhancements)
 
+    # Watch our own settings for changes that require cached state to be
+    # recreated.
+    es_setting.obj.add_on_change('_es_settings', _es_settings_changed)
+
 
 def unloaded():
     """
     Clean up every time the plugin is unloaded.
     """
     _settings_listener.shutdown()
+    es_setting.obj.clear_on_change('_es_settings')
+
+    # Stop the threads that asynchronous snippet enhancements run in.
+    if SnippetManager.instance is not None:
+        SnippetManager.instance.enhancements.shutdown()
+
+
+def _es_settings_changed():
+    """
+    Invoked whenever the EnhancedSnippets settings change; the state of debug
+    logging is cached, the snippet manager caches the completion items for
+    snippets, which depend on the value of the use_details setting, and the
+    enhancement manager caches the value of the enhancement_budget setting.
+    """
+    set_debug_logging(es_setting('debug'))
+    SnippetManager.instance.update_completions(es_setting('use_details'))
+    SnippetManager.instance.enhancements.update_budget(es_setting('enhancement_budget'))
 
 
 ## ----------------------------------------------------------------------------
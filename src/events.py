@@ -1,50 +1,16 @@
 import sublime
 import sublime_plugin
 
-from .core import es_setting, es_syntax
+from .core import es_syntax
 from ..lib import SnippetManager, snippet_expansion_args
 from ..lib import clear_snippet_info, handle_snippet_field_move
+from ..lib import discard_snippet_session, has_snippet_session
+from ..lib import perf
 
 
 ## ----------------------------------------------------------------------------
 
 
-# Our injected completions use this kind information to mark themselves in the
-# autocomplete panel; since we're effectively going to duplicate any snippets
-# that contain dates, this will help disambiguate them for people.
-RES_KIND_ENHANCED_SNIPPET = (sublime.KIND_ID_COLOR_BLUISH, "s", "Snippet [Enhanced]")
-
-
-## ----------------------------------------------------------------------------
-
-
-def _create_completions(snippet_list):
-    """
-    Given a list of objects that represent possible completions, expand them
-    out into full blown completion items and return back a new list that
-    contains them.
-    """
-    completions = []
-
-    # for each of the items in the input list, create a new completion item
-    # and insert it into the completions array.
-    for snippet in snippet_list:
-        completion = {
-            'trigger': snippet.trigger,
-            'command': 'insert_enhanced_snippet',
-            'args': { 'name': snippet.resource },
-            'annotation': f"{snippet.description}",
-            'kind': RES_KIND_ENHANCED_SNIPPET,
-        }
-
-        if es_setting('use_details'):
-            completion['details'] = 'Enhanced Snippet'
-
-        completions.append(sublime.CompletionItem.command_completion(**completion))
-
-    return completions
-
-
 def is_enhanced_snippet(name):
     """
     Checks to see if a filename looks like a snippet, which means that it has
@@ -111,8 +77,20 @@ class AugmentedSnippetEventListener(sublime_plugin.EventListener):
         if view.settings().get('auto_complete_include_snippets') == False:
             return None
 
-        snippets = SnippetManager.instance.match_view(view, locations)
-        return _create_completions(snippets)
+        with perf.timed('completions'):
+            manager = SnippetManager.instance
+            snippets = manager.match_view(view, locations, prefix)
+
+            # Get a head start on any variables whose values are slow to
+            # produce, in case one of these snippets is picked.
+            manager.prefetch(snippets)
+
+            return [manager.completion_item(snippet) for snippet in snippets]
+
+
+    def on_close(self, view):
+        SnippetManager.instance.discard_view(view)
+        discard_snippet_session(view)
 
 
     def on_load(self, view):
@@ -139,6 +117,11 @@ class AugmentedSnippetEventListener(sublime_plugin.EventListener):
 
 
     def on_text_command(self, view, command, args):
+        # This is called for every command in every view, so views that are
+        # not expanding an enhanced snippet bail out right away.
+        if not has_snippet_session(view):
+            return
+
         # Check the current command to see if it's indicating that a snippet
         # is about to expand; if so, then we know we should stop listening to
         # other special commands in that view.
@@ -0,0 +1,139 @@
+"""
+Tests for the memoization of the values of the DATE variable; these run outside
+of Sublime Text, using a plain Python 3.8 interpreter:
+
+    python3 -m unittest discover tests
+
+The Sublime API is provided by the stand-in modules that the benchmarks use.
+"""
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+
+
+## ----------------------------------------------------------------------------
+
+
+# The root of the package that we're testing, and the folder that holds the
+# stand-in modules for the Sublime API.
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_stubs = os.path.join(_root, 'benchmarks', 'stubs')
+
+
+## ----------------------------------------------------------------------------
+
+
+def setUpModule():
+    """
+    Make the package importable as EnhancedSnippets using the stand-in Sublime
+    API and load the plugin with no snippets, so that the built in
+    enhancements are available.
+    """
+    global _cache_folder
+    sys.path.insert(0, _stubs)
+
+    pkg = types.ModuleType('EnhancedSnippets')
+    pkg.__path__ = [_root]
+    sys.modules.setdefault('EnhancedSnippets', pkg)
+
+    import sublime
+    _cache_folder = tempfile.mkdtemp(prefix='es_test_')
+    sublime.cache_folder = _cache_folder
+
+    import EnhancedSnippets.enhanced_snippets as plugin
+    plugin.plugin_loaded()
+    sublime.run_timeouts()
+
+
+def tearDownModule():
+    shutil.rmtree(_cache_folder, ignore_errors=True)
+
+
+## ----------------------------------------------------------------------------
+
+
+class DateMemoTests(unittest.TestCase):
+    """
+    The values of the DATE variable are memoized, but all of the dates in an
+    expansion must still come from the same moment in time, and no date can be
+    reused once the time it displays has rolled over.
+    """
+    def setUp(self):
+        from EnhancedSnippets.lib import SnippetManager
+        from EnhancedSnippets.lib.enhancements import date
+
+        self.enhancements = SnippetManager.instance.enhancements
+        self.date = self.enhancements.get_variable_classes(['DATE'])[0]
+
+        # Each expansion starts with an empty memo, since the real clock is
+        # not what the memoized values were produced from.
+        self.enhancements._memo = {}
+
+        # Replace the clock that the DATE variable uses with one that the test
+        # controls.
+        self.now = None
+        test = self
+        class Clock(datetime.datetime):
+            @classmethod
+            def today(cls):
+                return test.now
+
+        self.module = date
+        self.original = (date.datetime, date.localtime)
+        date.datetime = Clock
+        date.localtime = lambda: self.now.timetuple()
+
+
+    def tearDown(self):
+        self.module.datetime, self.module.localtime = self.original
+
+
+    def expand(self, now, slots):
+        self.now = now
+        return self.enhancements.expand(self.date, slots)
+
+
+    def test_partially_memoized(self):
+        # Only the date is memoized before midnight; when the time is added
+        # after midnight, both need to agree.
+        self.expand(datetime.datetime(2026, 10, 16, 23, 59, 59, 500000),
+                    {'DATE_1': '%Y-%m-%d'})
+        values = self.expand(datetime.datetime(2026, 10, 17, 0, 0, 0, 200000),
+                             {'DATE_1': '%Y-%m-%d', 'DATE_2': '%H:%M'})
+
+        self.assertEqual(values, {'DATE_1': '2026-10-17', 'DATE_2': '00:00'})
+
+
+    def test_memoized(self):
+        first = self.expand(datetime.datetime(2026, 10, 16, 10, 30, 0, 100000),
+                            {'DATE_1': '%H:%M', 'DATE_2': '%H:%M'})
+        second = self.expand(datetime.datetime(2026, 10, 16, 10, 30, 0, 600000),
+                             {'DATE_1': '%H:%M'})
+
+        self.assertEqual(first, {'DATE_1': '10:30', 'DATE_2': '10:30'})
+        self.assertEqual(second, {'DATE_1': '10:30'})
+
+
+    def test_minute_rollover(self):
+        self.expand(datetime.datetime(2026, 10, 16, 10, 59, 59, 500000),
+                    {'DATE_1': '%H:%M'})
+        values = self.expand(datetime.datetime(2026, 10, 16, 11, 0, 0, 200000),
+                             {'DATE_1': '%H:%M'})
+
+        self.assertEqual(values, {'DATE_1': '11:00'})
+
+
+    def test_seconds_not_memoized(self):
+        self.expand(datetime.datetime(2026, 10, 16, 10, 30, 1, 100000),
+                    {'DATE_1': '%H:%M:%S'})
+        values = self.expand(datetime.datetime(2026, 10, 16, 10, 30, 2, 0),
+                             {'DATE_1': '%H:%M:%S'})
+
+        self.assertEqual(values, {'DATE_1': '10:30:02'})
+
+
+## ----------------------------------------------------------------------------